@@ -68,6 +68,30 @@ class Plugin:
             "placeholder": "The number of columns of channels to display on the 'Too Many Streams' image.",
             "help_text": "The number of columns of channels to display on the 'Too Many Streams' image.",
         },
+        {
+            "id": "carousel_interval",
+            "label": "Page Rotation Interval (s)",
+            "type": "number",
+            "default": int(_file_config.get("carousel_interval", 10)),
+            "placeholder": "10",
+            "help_text": "Seconds each page is shown when there are more channels than fit on one screen.",
+        },
+        {
+            "id": "carousel_max_pages",
+            "label": "Maximum Pages",
+            "type": "number",
+            "default": int(_file_config.get("carousel_max_pages", 10)),
+            "placeholder": "10",
+            "help_text": "Maximum number of channel pages to rotate through.",
+        },
+        {
+            "id": "personalize_splash",
+            "label": "Personalized Splash",
+            "type": "boolean",
+            "default": bool(_file_config.get("personalize_splash", True)),
+            "placeholder": "",
+            "help_text": "Show each channel group its own splash: the unavailable channel is hidden and same-group channels are listed first.",
+        },
         {
             "id": "tms_image_path",
             "label": "Static Image Path",
@@ -92,6 +116,118 @@ class Plugin:
             "placeholder": "libx264",
             "help_text": "FFmpeg encoder (e.g., libx264, h264_nvenc, h264_qsv, h264_omx, h264_videotoolbox). Use libx264 if unsure.",
         },
+        {
+            "id": "render_backend",
+            "label": "Render Backend",
+            "type": "string",
+            "default": _file_config.get("render_backend", "thread"),
+            "placeholder": "thread",
+            "help_text": "Where splash pages are drawn: 'thread' (inside Dispatcharr) or 'process' (an isolated worker process).",
+        },
+        {
+            "id": "render_timeout",
+            "label": "Render Timeout (s)",
+            "type": "number",
+            "default": int(_file_config.get("render_timeout", 30)),
+            "placeholder": "30",
+            "help_text": "Seconds a page may take to render in the worker process before it is killed.",
+        },
+        {
+            "id": "client_send_timeout",
+            "label": "Client Send Timeout (s)",
+            "type": "number",
+            "default": int(_file_config.get("client_send_timeout", 10)),
+            "placeholder": "10",
+            "help_text": "Seconds a write to a viewer may block before the connection is dropped.",
+        },
+        {
+            "id": "slow_client_policy",
+            "label": "Slow Viewer Policy",
+            "type": "string",
+            "default": _file_config.get("slow_client_policy", "skip"),
+            "placeholder": "skip",
+            "help_text": "What to do with viewers that can't keep up: 'skip' (jump to the latest keyframe) or 'disconnect'.",
+        },
+        {
+            "id": "slow_client_max_lag",
+            "label": "Slow Viewer Max Lag (s)",
+            "type": "number",
+            "default": int(_file_config.get("slow_client_max_lag", 10)),
+            "placeholder": "10",
+            "help_text": "With the 'disconnect' policy, seconds a viewer may stay behind before it is evicted.",
+        },
+        {
+            "id": "max_viewers",
+            "label": "Max Viewers",
+            "type": "number",
+            "default": int(_file_config.get("max_viewers", 200)),
+            "placeholder": "200",
+            "help_text": "Maximum concurrent connections to the splash server. A quarter is reserved for the local Dispatcharr proxy; extra connections get a 503 with Retry-After.",
+        },
+        {
+            "id": "max_viewers_per_ip",
+            "label": "Max Viewers per IP",
+            "type": "number",
+            "default": int(_file_config.get("max_viewers_per_ip", 10)),
+            "placeholder": "10",
+            "help_text": "Maximum concurrent connections from a single external IP. The local Dispatcharr proxy is exempt.",
+        },
+        {
+            "id": "profile_selection_strategy",
+            "label": "Profile Selection Strategy",
+            "type": "string",
+            "default": _file_config.get("profile_selection_strategy", "first_fit"),
+            "placeholder": "first_fit",
+            "help_text": "How a tuning channel picks an M3U profile: 'first_fit' (first profile with a free slot), 'least_loaded', 'weighted' (random, by remaining capacity) or 'sticky' (keep a channel on its last profile).",
+        },
+        {
+            "id": "auto_attach_stream",
+            "label": "Auto-Attach Stream",
+            "type": "boolean",
+            "default": bool(_file_config.get("auto_attach_stream", False)),
+            "placeholder": "",
+            "help_text": "Attach the 'Too Many Streams' stream to channels as they are created or imported, instead of on tune-in. Run 'Apply' once to cover existing channels.",
+        },
+        {
+            "id": "local_transport",
+            "label": "Local Transport",
+            "type": "boolean",
+            "default": bool(_file_config.get("local_transport", False)),
+            "placeholder": "",
+            "help_text": "Let Dispatcharr's proxy read the splash without a loopback TCP connection: directly from the broadcaster when in the same process, otherwise over a Unix socket. External clients keep using HTTP.",
+        },
+        {
+            "id": "promote_parked_viewers",
+            "label": "Promote Parked Viewers",
+            "type": "boolean",
+            "default": bool(_file_config.get("promote_parked_viewers", False)),
+            "placeholder": "",
+            "help_text": "When a provider slot frees up, switch the channel that has waited longest on the splash back to a real stream automatically.",
+        },
+        {
+            "id": "tunable_index",
+            "label": "Tunable Channels Only",
+            "type": "boolean",
+            "default": bool(_file_config.get("tunable_index", False)),
+            "placeholder": "",
+            "help_text": "Only suggest channels a viewer can actually join right now, using an index kept up to date in Redis as channel states change.",
+        },
+        {
+            "id": "saturation_sampling",
+            "label": "Sample Splash Usage",
+            "type": "boolean",
+            "default": bool(_file_config.get("saturation_sampling", False)),
+            "placeholder": "",
+            "help_text": "Every 15 seconds, record splash viewer-seconds per channel and the time each limited profile spends full, for the Saturation Report. Not available in static image mode.",
+        },
+        {
+            "id": "redis_keyspace_events",
+            "label": "Enable Redis Keyspace Events",
+            "type": "boolean",
+            "default": bool(_file_config.get("redis_keyspace_events", False)),
+            "placeholder": "",
+            "help_text": "Let the plugin switch on Redis keyspace notifications (notify-keyspace-events) so Promote Parked Viewers and Tunable Channels Only react immediately. This applies to the whole Redis server: every string, hash and key write and every expiry then publishes a message, including the proxy's stream buffer traffic. The setting is not reverted. When off, those features poll every 5 seconds unless notifications are already enabled.",
+        },
         {
             "id": "theme_bg_color",
             "label": "Background Color",
@@ -178,6 +314,21 @@ class Plugin:
             "label": "Search for Persistent Config",
             "description": "Manually searches for and reloads the persistent configuration file from disk.",
         },
+        {
+            "id": "stream_server_stats",
+            "label": "Stream Server Stats",
+            "description": "Returns encoder health, admission counters and per-viewer statistics (lag, drops, skips) for the 'Too Many Streams' stream.",
+        },
+        {
+            "id": "saturation_report",
+            "label": "Saturation Report",
+            "description": "Returns which channels, profiles and hours hit connection limits most, and how long viewers spent on the splash (last 24 hours by default).",
+        },
+        {
+            "id": "profile_plugin",
+            "label": "Profile Plugin",
+            "description": "Samples the updater, broadcaster and get_stream code paths and plugin memory allocations for 10 seconds. Results are saved under TMS_Persistent_Config/profiles and a summary is returned.",
+        },
     ]    
 
     def __init__(self):
@@ -194,6 +345,8 @@ class Plugin:
         image_to_use = config.tms_image_path
 
         TooManyStreams.install_get_stream_override()
+        TooManyStreams.install_auto_attach()
+        TooManyStreams.install_local_transport()
 
         if not self._can_bind(HOST, PORT):
             logger.error(f"Too Many Streams: Could not bind to {HOST}:{PORT}. Port might be in use.")
@@ -242,5 +395,13 @@ class Plugin:
             logger.info("Manually searching for and reloading config...")
             TooManyStreamsConfig.clear_cache()
             TooManyStreamsConfig.get_config()
+        elif action == "stream_server_stats":
+            return {"status": "ok", **TooManyStreams.get_stream_server_stats()}
+        elif action == "saturation_report":
+            hours = int((params or {}).get("hours", 24))
+            return {"status": "ok", **TooManyStreams.get_saturation_report(hours)}
+        elif action == "profile_plugin":
+            duration = float((params or {}).get("duration", 10))
+            return {"status": "ok", **TooManyStreams.profile_plugin(duration)}
 
         return {"status": "ok"}
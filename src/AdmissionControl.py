@@ -0,0 +1,82 @@
+import ipaddress
+import logging
+import threading
+
+logger = logging.getLogger('plugins.too_many_streams.AdmissionControl')
+
+
+class AdmissionControl:
+    """
+    Decides whether a new connection to the splash server may be served. Caps the total
+    number of connections, limits each external source IP, and keeps a share of the
+    capacity reserved for the local Dispatcharr proxy so a surge of direct external
+    clients can't lock out viewers coming through Dispatcharr.
+    """
+
+    # Share of max_connections only local (proxy) connections may use
+    LOCAL_RESERVED_SHARE = 0.25
+
+    def __init__(self, max_connections: int, max_per_ip: int, local_addresses=()):
+        self.max_connections = max(1, max_connections)
+        self.max_per_ip = max(1, max_per_ip)
+        self.max_external = max(1, int(self.max_connections * (1 - self.LOCAL_RESERVED_SHARE)))
+        self.local_addresses = {a for a in local_addresses if a and a != "0.0.0.0"}
+
+        self.lock = threading.Lock()
+        self.total = 0
+        self.external = 0
+        self.per_ip: dict[str, int] = {}
+        self.admitted = 0
+        self.rejected = 0
+
+    def is_local(self, ip: str) -> bool:
+        if ip in self.local_addresses:
+            return True
+        try:
+            return ipaddress.ip_address(ip).is_loopback
+        except ValueError:
+            return False
+
+    def try_admit(self, ip: str) -> bool:
+        local = self.is_local(ip)
+        with self.lock:
+            if self.total >= self.max_connections:
+                reason = "server full"
+            elif not local and self.external >= self.max_external:
+                reason = "external capacity reached"
+            elif not local and self.per_ip.get(ip, 0) >= self.max_per_ip:
+                reason = "per-IP limit reached"
+            else:
+                self.total += 1
+                if not local:
+                    self.external += 1
+                self.per_ip[ip] = self.per_ip.get(ip, 0) + 1
+                self.admitted += 1
+                return True
+            self.rejected += 1
+        logger.debug(f"Rejected connection from {ip}: {reason}")
+        return False
+
+    def release(self, ip: str) -> None:
+        with self.lock:
+            self.total = max(0, self.total - 1)
+            if not self.is_local(ip):
+                self.external = max(0, self.external - 1)
+            count = self.per_ip.get(ip, 0) - 1
+            if count > 0:
+                self.per_ip[ip] = count
+            else:
+                self.per_ip.pop(ip, None)
+
+    def stats(self) -> dict:
+        with self.lock:
+            return {
+                "connections": self.total,
+                "external_connections": self.external,
+                "max_connections": self.max_connections,
+                "max_external_connections": self.max_external,
+                "max_per_ip": self.max_per_ip,
+                "sources": len(self.per_ip),
+                "admitted": self.admitted,
+                "rejected": self.rejected,
+            }
@@ -0,0 +1,138 @@
+import logging
+import threading
+import time
+
+logger = logging.getLogger('plugins.too_many_streams.ChannelAttacher')
+
+
+class ChannelAttacher:
+    """
+    Keeps the TMS stream attached to every channel as channels appear, so coverage needs
+    neither periodic full sweeps nor ORM writes on the tune path. Channel and stream
+    assignment signals queue channel ids, the end of a bulk import (M3U refresh, channel
+    sync) queues a catch-up pass, and a background thread attaches them in batches.
+
+    Signals are per process: the hooks are installed wherever the plugin is loaded,
+    including the Celery workers that run imports.
+    """
+
+    # Coalesce bursts (e.g. a refresh creating hundreds of channels) into one batch
+    BATCH_DELAY_SEC = 2
+    # Celery tasks that create or rewire channels with bulk queries (no model signals).
+    # Other tasks in these apps (EPG refreshes, matching, periodic cleanups) never do.
+    BULK_TASKS = frozenset({
+        "apps.m3u.tasks.refresh_single_m3u_account",
+        "apps.m3u.tasks.sync_auto_channels",
+        "apps.channels.tasks.bulk_create_channels_from_streams",
+    })
+    DISPATCH_UID = "too_many_streams_auto_attach"
+
+    _instance = None
+
+    def __init__(self, attach):
+        # attach(channel_ids) attaches the stream where missing; None means every channel
+        self.attach = attach
+        self.lock = threading.Lock()
+        self.pending: set[int] = set()
+        self.sweep_pending = False
+        self.wakeup = threading.Event()
+        self.installed = False
+        self.attached = 0
+        self._thread = None
+
+    @classmethod
+    def get_instance(cls, attach=None) -> "ChannelAttacher":
+        if cls._instance is None:
+            cls._instance = cls(attach)
+        return cls._instance
+
+    def install(self) -> None:
+        if self.installed:
+            return
+        from django.db.models.signals import m2m_changed, post_save
+        from apps.channels.models import Channel, ChannelStream
+
+        post_save.connect(self._on_channel_saved, sender=Channel, weak=False, dispatch_uid=f"{self.DISPATCH_UID}_channel")
+        post_save.connect(self._on_channel_stream_saved, sender=ChannelStream, weak=False, dispatch_uid=f"{self.DISPATCH_UID}_channelstream")
+        m2m_changed.connect(self._on_streams_changed, sender=Channel.streams.through, weak=False, dispatch_uid=f"{self.DISPATCH_UID}_m2m")
+        try:
+            from celery.signals import task_postrun
+            task_postrun.connect(self._on_task_postrun, weak=False, dispatch_uid=f"{self.DISPATCH_UID}_task")
+        except ImportError:
+            logger.debug("Celery not available, bulk imports are covered by model signals only.")
+
+        self._thread = threading.Thread(target=self._attach_loop, daemon=True, name="TMS_ChannelAttacher")
+        self._thread.start()
+        self.installed = True
+        logger.info("Auto-attach enabled.")
+
+    def queue(self, channel_ids) -> None:
+        with self.lock:
+            self.pending.update(int(i) for i in channel_ids)
+        self.wakeup.set()
+
+    def queue_sweep(self) -> None:
+        """Attach to every channel still missing the stream (one query, no per-channel work)."""
+        with self.lock:
+            self.sweep_pending = True
+        self.wakeup.set()
+
+    def _on_channel_saved(self, sender, instance, created=False, **kwargs):
+        if created:
+            self.queue([instance.pk])
+
+    def _on_channel_stream_saved(self, sender, instance, created=False, **kwargs):
+        if created:
+            self.queue([instance.channel_id])
+
+    def _on_streams_changed(self, sender, instance, action, reverse=False, pk_set=None, **kwargs):
+        # Removals (including clearing a channel's streams) are left alone so
+        # 'Remove Too Many Streams' and manual edits stick
+        if action != "post_add":
+            return
+        if reverse:
+            # instance is a Stream, pk_set holds channel ids
+            if pk_set:
+                self.queue(pk_set)
+        else:
+            self.queue([instance.pk])
+
+    def _on_task_postrun(self, task=None, state=None, **kwargs):
+        name = getattr(task, "name", "") or ""
+        if state == "SUCCESS" and name in self.BULK_TASKS:
+            self.queue_sweep()
+
+    def flush(self) -> int:
+        with self.lock:
+            channel_ids, self.pending = self.pending, set()
+            sweep, self.sweep_pending = self.sweep_pending, False
+        if not channel_ids and not sweep:
+            return 0
+        count = self.attach(None if sweep else channel_ids)
+        self.attached += count
+        if count:
+            logger.info(f"Auto-attached the 'Too Many Streams' stream to {count} channel(s).")
+        return count
+
+    def _attach_loop(self):
+        while True:
+            self.wakeup.wait()
+            self.wakeup.clear()
+            # Let the rest of a burst arrive, and the transaction that created it commit
+            time.sleep(self.BATCH_DELAY_SEC)
+            try:
+                self.flush()
+            except Exception as e:
+                logger.error(f"Auto-attach failed: {e}", exc_info=True)
+                # Keep the work for the next wake-up rather than dropping it
+                self.queue_sweep()
+                time.sleep(30)
+
+    def stats(self) -> dict:
+        with self.lock:
+            return {
+                "enabled": self.installed,
+                "pending": len(self.pending),
+                "sweep_pending": self.sweep_pending,
+                "attached": self.attached,
+            }
@@ -0,0 +1,165 @@
+import logging
+import os
+import random
+import select
+import subprocess
+import threading
+import time
+from collections import deque
+
+from .exceptions import TMS_EncoderError
+
+logger = logging.getLogger('plugins.too_many_streams.EncoderWatchdog')
+
+
+class EncoderWatchdog:
+    """
+    Runs FFmpeg encodes under supervision. An encode that stops producing output is
+    treated as wedged and killed, repeated failures back off exponentially (with jitter)
+    instead of respawning in a tight loop, and the tail of stderr is kept for diagnosis.
+    """
+
+    STALL_TIMEOUT_SEC = 10
+    BACKOFF_BASE_SEC = 1
+    BACKOFF_MAX_SEC = 300
+    BACKOFF_JITTER = 0.2
+    STDERR_TAIL_LINES = 20
+    READ_SIZE = 65536
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.encodes = 0
+        self.failures = 0
+        self.consecutive_failures = 0
+        self.next_attempt_at = 0.0
+        self.last_error = None
+        self.last_stderr_tail: list[str] = []
+        self.last_duration = None
+        self.last_speed = None
+        self.last_bytes_per_sec = None
+        self.last_success_at = None
+
+    def backoff_remaining(self) -> float:
+        return max(0.0, self.next_attempt_at - time.monotonic())
+
+    def run(self, cmd: list, media_seconds: float, timeout: float) -> bytes:
+        """Runs one encode and returns its stdout. Raises TMS_EncoderError on failure or while backing off."""
+        with self.lock:
+            wait = self.backoff_remaining()
+            if wait > 0:
+                raise TMS_EncoderError(f"Encoder backing off for {wait:.1f}s after {self.consecutive_failures} failure(s)")
+
+            start = time.monotonic()
+            try:
+                data = self._run(cmd, timeout)
+            except TMS_EncoderError as e:
+                self._record_failure(str(e))
+                raise
+
+            elapsed = max(time.monotonic() - start, 1e-6)
+            self.encodes += 1
+            self.consecutive_failures = 0
+            self.next_attempt_at = 0.0
+            self.last_duration = elapsed
+            self.last_speed = media_seconds / elapsed
+            self.last_bytes_per_sec = len(data) / elapsed
+            self.last_success_at = time.time()
+            if self.last_speed < 1:
+                logger.warning(f"Encoder is slower than real time ({self.last_speed:.2f}x), consider a lighter encoder.")
+            return data
+
+    def _record_failure(self, error: str) -> None:
+        self.failures += 1
+        self.consecutive_failures += 1
+        self.last_error = error
+        delay = min(self.BACKOFF_MAX_SEC, self.BACKOFF_BASE_SEC * (2 ** (self.consecutive_failures - 1)))
+        delay *= 1 + random.uniform(-self.BACKOFF_JITTER, self.BACKOFF_JITTER)
+        self.next_attempt_at = time.monotonic() + delay
+        logger.error(f"Encode failed ({error}), next attempt in {delay:.1f}s")
+        if self.last_stderr_tail:
+            logger.error("FFmpeg stderr:\n" + "\n".join(self.last_stderr_tail))
+
+    @staticmethod
+    def _drain_stderr(pipe, tail: deque) -> None:
+        try:
+            for line in iter(pipe.readline, b""):
+                tail.append(line.decode(errors="replace").rstrip())
+        except Exception:
+            pass
+
+    @staticmethod
+    def _kill(proc: subprocess.Popen) -> None:
+        try:
+            proc.kill()
+            proc.wait(timeout=2)
+        except Exception as e:
+            logger.warning(f"Error killing FFmpeg: {e}")
+
+    def _run(self, cmd: list, timeout: float) -> bytes:
+        try:
+            proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        except Exception as e:
+            self.last_stderr_tail = []
+            raise TMS_EncoderError(f"Failed to start FFmpeg: {e}")
+
+        tail = deque(maxlen=self.STDERR_TAIL_LINES)
+        stderr_thread = threading.Thread(target=self._drain_stderr, args=(proc.stderr, tail), daemon=True)
+        stderr_thread.start()
+
+        out = bytearray()
+        fd = proc.stdout.fileno()
+        start = last_output = time.monotonic()
+        try:
+            while True:
+                now = time.monotonic()
+                if now - start > timeout:
+                    raise TMS_EncoderError(f"Encode timed out after {timeout}s")
+                if now - last_output > self.STALL_TIMEOUT_SEC:
+                    raise TMS_EncoderError(f"Encoder stalled, no output for {self.STALL_TIMEOUT_SEC}s")
+
+                ready, _, _ = select.select([fd], [], [], 0.5)
+                if not ready:
+                    continue
+                chunk = os.read(fd, self.READ_SIZE)
+                if not chunk:
+                    break
+                out.extend(chunk)
+                last_output = time.monotonic()
+
+            proc.wait(timeout=self.STALL_TIMEOUT_SEC)
+        except subprocess.TimeoutExpired:
+            self._kill(proc)
+            raise TMS_EncoderError("FFmpeg did not exit after closing its output")
+        except TMS_EncoderError:
+            self._kill(proc)
+            raise
+        finally:
+            proc.stdout.close()
+            stderr_thread.join(timeout=1)
+            self.last_stderr_tail = list(tail)
+
+        if proc.returncode != 0 or not out:
+            raise TMS_EncoderError(f"FFmpeg exited with {proc.returncode}")
+        return bytes(out)
+
+    def health(self) -> dict:
+        backoff = self.backoff_remaining()
+        if self.consecutive_failures == 0:
+            state = "ok"
+        elif backoff > 0:
+            state = "backoff"
+        else:
+            state = "failing"
+        return {
+            "state": state,
+            "encodes": self.encodes,
+            "failures": self.failures,
+            "consecutive_failures": self.consecutive_failures,
+            "backoff_remaining_sec": round(backoff, 1),
+            "last_error": self.last_error,
+            "stderr_tail": self.last_stderr_tail,
+            "last_duration_sec": round(self.last_duration, 2) if self.last_duration else None,
+            "last_speed": round(self.last_speed, 2) if self.last_speed else None,
+            "last_bytes_per_sec": int(self.last_bytes_per_sec) if self.last_bytes_per_sec else None,
+            "last_success_at": self.last_success_at,
+        }
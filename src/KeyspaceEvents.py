@@ -0,0 +1,54 @@
+import logging
+
+from .TooManyStreamsConfig import TooManyStreamsConfig
+
+logger = logging.getLogger('plugins.too_many_streams.KeyspaceEvents')
+
+
+def enable(redis_client, flags: str) -> bool:
+    """
+    Checks that Redis publishes keyspace notifications for the given event classes
+    (e.g. "$" for strings, "h" for hashes). Missing classes are only added with the
+    redis_keyspace_events setting, since the setting is server-wide and makes every
+    matching write publish a message. Returns False when callers should poll instead.
+    """
+    try:
+        current = redis_client.config_get("notify-keyspace-events").get("notify-keyspace-events", "")
+        if isinstance(current, bytes):
+            current = current.decode()
+        wanted = "K" + flags
+        missing = "".join(f for f in wanted if f not in current and not (f != "K" and "A" in current))
+        if not missing:
+            return True
+        if not TooManyStreamsConfig.get_config().redis_keyspace_events:
+            logger.info(f"Redis keyspace notifications '{wanted}' are not enabled, polling instead.")
+            return False
+        redis_client.config_set("notify-keyspace-events", current + missing)
+        logger.info(f"Enabled Redis keyspace notifications '{current + missing}'.")
+        return True
+    except Exception as e:
+        logger.info(f"Redis keyspace notifications unavailable: {e}")
+        return False
+
+
+def subscribe(redis_client, *patterns: str):
+    """PubSub subscribed to keyspace notifications for keys matching the patterns."""
+    db = redis_client.connection_pool.connection_kwargs.get("db", 0)
+    pubsub = redis_client.pubsub(ignore_subscribe_messages=True)
+    pubsub.psubscribe(*[f"__keyspace@{db}__:{pattern}" for pattern in patterns])
+    return pubsub
+
+
+def drain(pubsub, timeout: float) -> list[tuple[str, str]]:
+    """Waits up to timeout for an event, then returns it with everything queued behind it as (key, event)."""
+    events = []
+    message = pubsub.get_message(timeout=timeout)
+    while message:
+        channel, event = message.get("channel"), message.get("data")
+        if isinstance(channel, bytes):
+            channel = channel.decode()
+        if isinstance(event, bytes):
+            event = event.decode()
+        events.append((channel.split(":", 1)[1] if channel else "", event))
+        message = pubsub.get_message(timeout=0)
+    return events
@@ -0,0 +1,209 @@
+import io
+import logging
+import os
+import queue
+import socket
+import time
+from urllib.parse import parse_qs, urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+from requests.structures import CaseInsensitiveDict
+from urllib3.connection import HTTPConnection
+from urllib3.connectionpool import HTTPConnectionPool
+
+from .StreamServer import AdmissionHTTPServer
+
+logger = logging.getLogger('plugins.too_many_streams.LocalTransport')
+
+
+class InProcessSplashReader(io.RawIOBase):
+    """
+    Response body that reads a viewer's chunks straight from the broadcaster's queue.
+    Stands in for the socket when the proxy and the stream server share a process.
+    """
+
+    POLL_SEC = 1
+
+    def __init__(self, server, client, broadcast):
+        self.server = server
+        self.client = client
+        self.broadcast = broadcast
+        self._pending = b""
+        self._done = False
+
+    def readable(self) -> bool:
+        return True
+
+    def _next_chunk(self) -> bytes:
+        while not self.closed:
+            try:
+                chunk = self.client.get(timeout=self.POLL_SEC)
+            except queue.Empty:
+                continue
+            if chunk is None:
+                break
+            self.client.record_sent(len(chunk))
+            return chunk
+        self._done = True
+        return b""
+
+    def read(self, amt: int = -1) -> bytes:
+        if not self._pending and not self._done:
+            self._pending = self._next_chunk()
+        if amt is None or amt < 0:
+            data, self._pending = self._pending, b""
+        else:
+            data, self._pending = self._pending[:amt], self._pending[amt:]
+        return data
+
+    def readinto(self, b) -> int:
+        data = self.read(len(b))
+        b[:len(data)] = data
+        return len(data)
+
+    def stream(self, chunk_size: int = None, decode_content=None):
+        """The interface requests' iter_content() uses on urllib3 responses."""
+        while True:
+            data = self.read(chunk_size or -1)
+            if not data:
+                return
+            yield data
+
+    def release_conn(self) -> None:
+        self.close()
+
+    def close(self) -> None:
+        if not self.closed:
+            self.server.detach_client(self.client, self.broadcast)
+            self.server.admission.release("127.0.0.1")
+        super().close()
+
+
+class _UnixHTTPConnection(HTTPConnection):
+    def __init__(self, *args, socket_path: str = None, **kwargs):
+        self.socket_path = socket_path
+        super().__init__(*args, **kwargs)
+
+    def _new_conn(self):
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        if isinstance(self.timeout, (int, float)):
+            sock.settimeout(self.timeout)
+        sock.connect(self.socket_path)
+        return sock
+
+
+class _UnixConnectionPool(HTTPConnectionPool):
+    ConnectionCls = _UnixHTTPConnection
+
+    def __init__(self, socket_path: str, **kwargs):
+        super().__init__("localhost", **kwargs)
+        self.conn_kw["socket_path"] = socket_path
+
+
+class SplashTransportAdapter(HTTPAdapter):
+    """
+    requests transport for the TMS stream URL. Viewers are attached to the broadcaster
+    directly when the stream server runs in this process, and otherwise reach it over
+    its Unix domain socket. Anything else (HLS, a missing socket) goes over TCP as before.
+    """
+
+    # After a failed connect (e.g. a stale socket file), use TCP for a while
+    UNIX_RETRY_SEC = 30
+
+    def __init__(self, get_server, socket_path: str, **kwargs):
+        self.get_server = get_server
+        self.socket_path = socket_path
+        self._unix_pool = None
+        self._unix_failed_at = None
+        super().__init__(**kwargs)
+
+    def _use_unix_socket(self) -> bool:
+        if self._unix_failed_at is not None and time.monotonic() - self._unix_failed_at < self.UNIX_RETRY_SEC:
+            return False
+        return os.path.exists(self.socket_path)
+
+    def _get_unix_pool(self):
+        if self._unix_pool is None:
+            self._unix_pool = _UnixConnectionPool(self.socket_path, maxsize=self._pool_maxsize)
+        return self._unix_pool
+
+    def get_connection_with_tls_context(self, request, verify, proxies=None, cert=None):
+        if self._use_unix_socket():
+            return self._get_unix_pool()
+        return super().get_connection_with_tls_context(request, verify, proxies=proxies, cert=cert)
+
+    def get_connection(self, url, proxies=None):
+        # requests < 2.32
+        if self._use_unix_socket():
+            return self._get_unix_pool()
+        return super().get_connection(url, proxies)
+
+    def send(self, request, stream=False, timeout=None, verify=True, cert=None, proxies=None):
+        server = self.get_server()
+        url = urlsplit(request.url)
+        if server is not None and server.serving and request.method == "GET" and url.path in ("/", "/stream.ts"):
+            return self._send_in_process(server, request, url)
+        kwargs = dict(stream=stream, timeout=timeout, verify=verify, cert=cert, proxies=proxies)
+        if not self._use_unix_socket():
+            return super().send(request, **kwargs)
+        try:
+            return super().send(request, **kwargs)
+        except requests.ConnectionError as e:
+            logger.warning(f"Unix socket {self.socket_path} unavailable ({e}), falling back to TCP.")
+            self._unix_failed_at = time.monotonic()
+            return super().send(request, **kwargs)
+
+    def _send_in_process(self, server, request, url) -> requests.Response:
+        query = parse_qs(url.query)
+        def _int_param(name):
+            try:
+                return int(query[name][0])
+            except (KeyError, IndexError, ValueError):
+                return None
+
+        response = requests.Response()
+        response.url = request.url
+        response.request = request
+        response.connection = self
+        response.encoding = None
+
+        if not server.admission.try_admit("127.0.0.1"):
+            response.status_code = 503
+            response.reason = "Service Unavailable"
+            response.headers = CaseInsensitiveDict({"Retry-After": str(AdmissionHTTPServer.RETRY_AFTER_SEC), "Content-Length": "0"})
+            response.raw = io.BytesIO(b"")
+            return response
+
+        client, broadcast = server.attach_client("in-process", _int_param("group"), _int_param("channel"))
+        response.status_code = 200
+        response.reason = "OK"
+        response.headers = CaseInsensitiveDict({"Content-Type": "video/mp2t", "Cache-Control": "no-cache"})
+        response.raw = InProcessSplashReader(server, client, broadcast)
+        return response
+
+    def close(self):
+        super().close()
+        if self._unix_pool is not None:
+            self._unix_pool.close()
+            self._unix_pool = None
+
+
+class LocalTransport:
+    """Mounts SplashTransportAdapter for the TMS stream URL on every requests.Session."""
+
+    @staticmethod
+    def install(get_server, stream_url: str, socket_path: str) -> None:
+        if getattr(requests.Session, "_tms_orig_init", None) is not None:
+            return
+        split = urlsplit(stream_url)
+        prefix = f"{split.scheme}://{split.netloc}/"
+
+        requests.Session._tms_orig_init = requests.Session.__init__
+
+        def _wrapped_init(self, *args, **kwargs):
+            requests.Session._tms_orig_init(self, *args, **kwargs)
+            self.mount(prefix, SplashTransportAdapter(get_server, socket_path))
+
+        requests.Session.__init__ = _wrapped_init
+        logger.info(f"Local transport enabled for {prefix} (unix socket {socket_path}).")
@@ -0,0 +1,135 @@
+import logging
+import threading
+import time
+
+from core.utils import RedisClient
+
+from . import KeyspaceEvents
+
+logger = logging.getLogger('plugins.too_many_streams.ParkedViewers')
+
+PROMOTE_DONE = "promoted"
+PROMOTE_WAIT = "waiting"
+PROMOTE_GONE = "gone"
+
+
+class ParkedViewers:
+    """
+    Tracks channels whose viewers are parked on the TMS stream and moves them back to a
+    real stream as soon as a profile slot frees, instead of leaving clients to retune
+    blindly. Parked channels live in a Redis sorted set scored by when they were parked,
+    so the longest-waiting channel is promoted first.
+
+    Releases are picked up from keyspace notifications on profile_connections:* when
+    Redis has them (see KeyspaceEvents.enable); otherwise the counters are polled. Either way a release costs one targeted switch rather than repeated tune-ins.
+    """
+
+    PARKED_KEY = "tms:parked"
+    # Give up on channels parked for longer than this (e.g. a viewer that never left)
+    MAX_PARK_SEC = 6 * 3600
+    # Parked channels examined per release, oldest first
+    PROMOTE_BATCH = 20
+    POLL_SEC = 5
+    # Strings for the counter writes, generic and expired for DEL and TTL expiry
+    KEYSPACE_FLAGS = "$gx"
+    RELEASE_EVENTS = {"decr", "decrby", "del", "set", "expired"}
+
+    _instance = None
+
+    def __init__(self, promote):
+        # promote(channel_id) -> PROMOTE_DONE, PROMOTE_WAIT or PROMOTE_GONE
+        self.promote = promote
+        self.lock = threading.Lock()
+        self.keyspace_events = False
+        self.promotions = 0
+        self.releases_seen = 0
+        self._thread = None
+
+    @classmethod
+    def get_instance(cls, promote=None) -> "ParkedViewers":
+        if cls._instance is None:
+            cls._instance = cls(promote)
+        return cls._instance
+
+    @staticmethod
+    def park(channel_id) -> None:
+        """Called from get_stream when a channel is handed the TMS stream. NX keeps the original wait time."""
+        try:
+            RedisClient.get_client().zadd(ParkedViewers.PARKED_KEY, {str(channel_id): time.time()}, nx=True)
+        except Exception as e:
+            logger.debug(f"Could not park channel {channel_id}: {e}")
+
+    @staticmethod
+    def unpark(channel_id) -> None:
+        RedisClient.get_client().zrem(ParkedViewers.PARKED_KEY, str(channel_id))
+
+    def start(self) -> None:
+        """Run in the process that owns the stream server only, so each release is acted on once."""
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._watch_loop, daemon=True, name="TMS_ParkedPromoter")
+            self._thread.start()
+
+    def _watch_loop(self):
+        redis_client = RedisClient.get_client()
+        pubsub = None
+        if KeyspaceEvents.enable(redis_client, self.KEYSPACE_FLAGS):
+            pubsub = KeyspaceEvents.subscribe(redis_client, "profile_connections:*")
+            self.keyspace_events = True
+        else:
+            logger.info("Polling profile connections for released slots.")
+
+        last_poll = 0.0
+        while True:
+            try:
+                released = 0
+                if pubsub is not None:
+                    events = KeyspaceEvents.drain(pubsub, self.POLL_SEC)
+                    released = sum(1 for _, event in events if event in self.RELEASE_EVENTS)
+                else:
+                    time.sleep(self.POLL_SEC)
+
+                now = time.monotonic()
+                if released:
+                    self.releases_seen += released
+                    self.promote_waiting(released)
+                elif now - last_poll >= self.POLL_SEC * 6 or pubsub is None:
+                    # Safety net for missed events (and the only trigger without keyspace events)
+                    self.promote_waiting(None)
+                    last_poll = now
+            except Exception as e:
+                logger.error(f"Parked viewer promotion failed: {e}", exc_info=True)
+                time.sleep(self.POLL_SEC)
+
+    def promote_waiting(self, slots: int = None) -> int:
+        """Promotes up to `slots` parked channels (all that fit if None), longest waiting first."""
+        redis_client = RedisClient.get_client()
+        redis_client.zremrangebyscore(self.PARKED_KEY, "-inf", time.time() - self.MAX_PARK_SEC)
+        parked = redis_client.zrange(self.PARKED_KEY, 0, self.PROMOTE_BATCH - 1)
+        promoted = 0
+        with self.lock:
+            for member in parked:
+                if slots is not None and promoted >= slots:
+                    break
+                channel_id = int(member)
+                result = self.promote(channel_id)
+                if result == PROMOTE_WAIT:
+                    continue
+                self.unpark(channel_id)
+                if result == PROMOTE_DONE:
+                    promoted += 1
+                    self.promotions += 1
+                    logger.info(f"Promoted parked channel {channel_id} back to a real stream.")
+        return promoted
+
+    def stats(self) -> dict:
+        try:
+            parked = RedisClient.get_client().zcard(self.PARKED_KEY)
+        except Exception:
+            parked = None
+        return {
+            "enabled": self._thread is not None,
+            "keyspace_events": self.keyspace_events,
+            "parked_channels": parked,
+            "releases_seen": self.releases_seen,
+            "promotions": self.promotions,
+        }
@@ -2,25 +2,44 @@ import logging
 import os
 import re
 import requests
-import textwrap
 import time
-from PIL import Image, ImageDraw, ImageFont
-from io import BytesIO
 from hashlib import md5
+from typing import NamedTuple, Optional
+from urllib.parse import urlparse
 
 from apps.channels.models import Channel
 from apps.proxy.ts_proxy.server import ProxyServer
 from apps.proxy.ts_proxy.channel_status import ChannelStatus
 
+from .PillowRenderer import MAX_COLS, ROWS_PER_PAGE, render_page
+from .RenderWorker import RenderWorker
 from .TooManyStreamsConfig import TooManyStreamsConfig
+from .TunableIndex import TunableIndex
+from .exceptions import TMS_RenderWorkerError
 
 
 DEFAULT_OUT_FILE = "too_many_streams.jpg"
 CACHE_DIR = "/tmp/tms_logos"
 
+RENDER_BACKEND_THREAD = "thread"
+RENDER_BACKEND_PROCESS = "process"
+
+
+class ActiveChannel(NamedTuple):
+    num: str
+    logo_url: str
+    name: str
+    channel_id: int
+    group_id: Optional[int]
+
+
 class PillowImageGen:
     """
-    Generates a 1920x1080 JPG image of active streams using Pillow.
+    Generates 1920x1080 JPG images of active streams using Pillow.
+    When there are more channels than fit on one grid, one image is written per page:
+    the first page to out_path and the rest next to it (see page_path()).
+    The drawing itself lives in PillowRenderer and runs either in this thread or, with
+    render_backend="process", in the RenderWorker subprocess.
     Optimized for low CPU usage with reliable state detection.
     """
     
@@ -33,24 +52,69 @@ class PillowImageGen:
         config = TooManyStreamsConfig.get_config()
         self.title = config.stream_title
         self.description = config.stream_description
-        self.html_cols = max(1, int(config.stream_channel_cols))
+        self.html_cols = min(max(1, int(config.stream_channel_cols)), MAX_COLS)
+        self.max_pages = max(1, int(config.carousel_max_pages))
         self.out_path = out_path
-        self.active_streams: list[tuple[str, str, str]] = []
+        self.active_streams: list[ActiveChannel] = []
+        self.page_paths: list[str] = [out_path]
         self._current_uuids = []
+        # Variant renders must not move the default splash's change marker
+        self.track_changes = True
 
         self.logger = logging.getLogger("plugins.too_many_streams.PillowImageGen")
         self.logger.setLevel(config.tms_log_level)
+        if int(config.stream_channel_cols) > MAX_COLS:
+            self.logger.warning(f"stream_channel_cols={config.stream_channel_cols} does not fit the canvas, using {MAX_COLS}.")
         
         os.makedirs(CACHE_DIR, exist_ok=True)
 
-    def _get_cached_logo(self, url: str) -> Image.Image:
+    @staticmethod
+    def logo_cache_stats() -> dict:
+        """Files and bytes in the on-disk cache of remote logos."""
+        files = size = 0
+        try:
+            with os.scandir(CACHE_DIR) as entries:
+                for entry in entries:
+                    if entry.is_file():
+                        files += 1
+                        size += entry.stat().st_size
+        except FileNotFoundError:
+            pass
+        return {"path": CACHE_DIR, "files": files, "bytes": size}
+
+    @staticmethod
+    def _local_logo_path(url: str) -> Optional[str]:
+        """
+        Dispatcharr stores uploaded and cached logos as plain file paths in Logo.url
+        (e.g. /data/logos/...). Those are read straight from disk instead of over HTTP.
+        """
+        if url.startswith("file://"):
+            url = urlparse(url).path
+        elif urlparse(url).scheme:
+            return None
+        return url if os.path.isabs(url) else None
+
+    def _get_cached_logo(self, url: str) -> bytes:
+        """Returns the raw logo bytes; decoding is left to the renderer."""
         if not url: return None
+
+        local_path = self._local_logo_path(url)
+        if local_path:
+            try:
+                with open(local_path, "rb") as f:
+                    return f.read()
+            except OSError as e:
+                self.logger.debug(f"Could not read logo {local_path}: {e}")
+                return None
+
+        # Truly remote logo: fetch over HTTP and keep a copy in our own cache
         hashed_url = md5(url.encode()).hexdigest()
         cache_path = os.path.join(CACHE_DIR, hashed_url)
         
         if os.path.exists(cache_path) and (time.time() - os.path.getmtime(cache_path) < 3600):
             try:
-                return Image.open(cache_path).convert("RGBA")
+                with open(cache_path, "rb") as f:
+                    return f.read()
             except Exception: pass
 
         try:
@@ -58,7 +122,7 @@ class PillowImageGen:
             if resp.status_code == 200:
                 with open(cache_path, "wb") as f:
                     f.write(resp.content)
-                return Image.open(BytesIO(resp.content)).convert("RGBA")
+                return resp.content
         except Exception: pass
         return None
 
@@ -89,27 +153,39 @@ class PillowImageGen:
             if not active_uuids: 
                 self.active_streams = []
             else:
-                channels = Channel.objects.filter(uuid__in=active_uuids).only('id', 'name', 'logo', 'uuid')
+                channels = Channel.objects.filter(uuid__in=active_uuids).select_related('logo') \
+                    .only('id', 'name', 'uuid', 'channel_group', 'logo', 'logo__url')
                 active_list = []
-                tms_url = TooManyStreamsConfig.get_stream_url()
+                tunable = TunableIndex.get_tunable_uuids() if TooManyStreamsConfig.get_config().tunable_index else None
+                untunable = []
                 
                 for ch in channels:
-                    channel_info = ChannelStatus.get_basic_channel_info(str(ch.uuid))
-                    if channel_info.get("url") == tms_url:
-                        continue
+                    if tunable is not None:
+                        # The index leaves out channels serving the TMS stream or in a failed state
+                        if str(ch.uuid) not in tunable:
+                            untunable.append(ch.id)
+                            continue
+                    else:
+                        channel_info = ChannelStatus.get_basic_channel_info(str(ch.uuid))
+                        if TooManyStreamsConfig.is_stream_url(channel_info.get("url")):
+                            continue
                     
-                    active_list.append((
+                    active_list.append(ActiveChannel(
                         f"#{ch.id}", 
                         ch.logo.url if ch.logo else "", 
-                        ch.name
+                        ch.name,
+                        ch.id,
+                        ch.channel_group_id,
                     ))
                 
                 def channel_sort_key(item):
-                    num_str = item[0].lstrip("#")
+                    num_str = item.num.lstrip("#")
                     return int(num_str) if num_str.isdigit() else 999999
                 
                 active_list.sort(key=channel_sort_key)
-                self.active_streams = active_list[:15] 
+                self.active_streams = active_list
+                # A running channel dropping out of the index changes the grid too
+                self._current_uuids = active_uuids + [f"untunable:{cid}" for cid in sorted(untunable)]
 
             # Detect change
             has_changed = self._current_uuids != PillowImageGen._last_active_uuids
@@ -119,6 +195,50 @@ class PillowImageGen:
             self.logger.error("Error in get_active_streams", exc_info=True)
             return True # Force generation on error to be safe
 
+    def get_maxed_channel_ids(self) -> set[int]:
+        """IDs of channels that recently hit their connection limits (see TooManyStreams.mark_streams_maxed)."""
+        maxed = set()
+        try:
+            redis_client = ProxyServer.get_instance().redis_client
+            cursor = 0
+            while True:
+                cursor, keys = redis_client.scan(cursor, match="tms:maxed_out:*")
+                for key in keys:
+                    try: maxed.add(int(key.decode("utf-8").rsplit(":", 1)[1]))
+                    except (ValueError, IndexError): continue
+                if cursor == 0: break
+        except Exception:
+            self.logger.error("Error reading maxed out channels", exc_info=True)
+        return maxed
+
+    def select_variant(self, group_id: int = None, exclude_ids: set = None) -> None:
+        """Personalizes the channel list: drops excluded channels and lists same-group channels first."""
+        exclude_ids = exclude_ids or set()
+        streams = [s for s in self.active_streams if s.channel_id not in exclude_ids]
+        if group_id is not None:
+            # Stable sort keeps channel order within each half
+            streams.sort(key=lambda s: s.group_id != group_id)
+        self.active_streams = streams
+        self.track_changes = False
+
+    def content_key(self) -> str:
+        """Hash of everything a render depends on, to skip renders that would produce the same pages."""
+        config = TooManyStreamsConfig.get_config()
+        visible = self.active_streams[:self.page_size * self.max_pages]
+        return md5(repr((visible, self.html_cols, config)).encode()).hexdigest()
+
+    @property
+    def page_size(self) -> int:
+        return self.html_cols * ROWS_PER_PAGE
+
+    @staticmethod
+    def page_path(out_path: str, page: int) -> str:
+        """Path of the given (0-based) page image. Page 0 is out_path itself."""
+        if page == 0:
+            return out_path
+        root, ext = os.path.splitext(out_path)
+        return f"{root}_p{page + 1}{ext}"
+
     def _hex_to_rgb(self, hex_color: str, default: tuple) -> tuple:
         try:
             hex_color = hex_color.lstrip('#')
@@ -127,103 +247,63 @@ class PillowImageGen:
             return default
 
     def generate(self, force=False) -> bool:
-        """Generates the image. Force=True bypasses the change check."""
+        """Generates the page images. Force=True bypasses the change check."""
         if not force and self._current_uuids == PillowImageGen._last_active_uuids and os.path.exists(self.out_path):
             return False
 
-        width, height = 1920, 1080
-        config = TooManyStreamsConfig.get_config()
-        
-        bg_color = self._hex_to_rgb(config.theme_bg_color, (15, 23, 42))
-        title_color = self._hex_to_rgb(config.theme_text_color, (248, 250, 252))
-        desc_color = (148, 163, 184) # Keep secondary text static or derive? Let's keep it static for now or add config later.
-        
-        card_bg = self._hex_to_rgb(config.theme_card_bg_color, (30, 41, 59))
-        card_border = self._hex_to_rgb(config.theme_card_border_color, (51, 65, 85))
-        
-        pill_bg_color = self._hex_to_rgb(config.theme_accent_color, (56, 189, 248))
-        pill_text_color = self._hex_to_rgb(config.theme_accent_text_color, (15, 23, 42))
-        
-        name_color = title_color # Use main text color for channel names
-        unavailable_color = (239, 68, 68)
-        
-        try:
-            img = Image.new('RGBA', (width, height), color=bg_color + (255,))
-            draw = ImageDraw.Draw(img)
-
-            def load_font(size, bold=False):
-                fonts = ["arialbd.ttf", "arial.ttf", "/usr/share/fonts/truetype/dejavu/DejaVuSans-Bold.ttf"]
-                for f in fonts:
-                    try: return ImageFont.truetype(f, size)
-                    except: continue
-                return ImageFont.load_default()
-
-            title_font, desc_font = load_font(48, True), load_font(20)
-            name_font, pill_font = load_font(22, True), load_font(14, True)
+        visible = self.active_streams[:self.page_size * self.max_pages]
+        pages = [visible[i:i + self.page_size] for i in range(0, len(visible), self.page_size)] or [[]]
 
-            if not self.active_streams:
-                unavailable_text = "This Channel is Unavailable"
-                bbox = draw.textbbox((0, 0), unavailable_text, font=title_font)
-                draw.text(((width - (bbox[2] - bbox[0])) / 2, (height - (bbox[3] - bbox[1])) / 2), 
-                          unavailable_text, font=title_font, fill=unavailable_color)
-            else:
-                bbox = draw.textbbox((0, 0), self.title, font=title_font)
-                draw.text(((width - (bbox[2] - bbox[0])) / 2, 100), self.title, font=title_font, fill=title_color)
-
-                content_width = 1440
-                grid_margin = (width - content_width) / 2
-                wrapper = textwrap.TextWrapper(width=100)
-                desc_lines = wrapper.wrap(text=self.description)
-                current_y = 180
-                for line in desc_lines:
-                    bbox = draw.textbbox((0, 0), line, font=desc_font)
-                    draw.text(((width - (bbox[2] - bbox[0])) / 2, current_y), line, font=desc_font, fill=desc_color)
-                    current_y += 32
-
-                cols, card_spacing = self.html_cols, 24
-                card_w = (content_width - (card_spacing * (cols - 1))) / cols
-                card_h, grid_y_start = 200, 350
-
-                for i, (channel_num, icon_url, channel_name) in enumerate(self.active_streams):
-                    col, row = i % cols, i // cols
-                    x = grid_margin + col * (card_w + card_spacing)
-                    y = grid_y_start + row * (card_h + card_spacing)
-                    
-                    # Alternating card background slightly? 
-                    # The original code had card_bg_odd/even. 
-                    # Let's simplify to just one card_bg for custom themes, or darken one slightly.
-                    # We will stick to the single configured card color for consistency.
-                    
-                    draw.rounded_rectangle([x, y, x + card_w, y + card_h], radius=12, fill=card_bg + (255,), outline=card_border + (255,), width=2)
-                    
-                    px, py = 24, 24
-                    pill_text = f"CH {channel_num.replace('#', '')}"
-                    p_bbox = draw.textbbox((0, 0), pill_text, font=pill_font)
-                    p_w, p_h = (p_bbox[2] - p_bbox[0]) + 24, (p_bbox[3] - p_bbox[1]) + 12
-                    draw.rounded_rectangle([x + px, y + py, x + px + p_w, y + py + p_h], radius=6, fill=pill_bg_color + (255,))
-                    draw.text((x + px + 12, y + py + 6), pill_text, font=pill_font, fill=pill_text_color)
-                    icon_size = 80
-                    icon_x, icon_y = x + px, y + py + p_h + 16
-                    icon = self._get_cached_logo(icon_url)
-                    if icon:
-                        icon.thumbnail((icon_size, icon_size), Image.Resampling.LANCZOS)
-                        draw.rounded_rectangle([icon_x, icon_y, icon_x + icon_size, icon_y + icon_size], radius=8, fill=bg_color + (255,), outline=card_border + (255,), width=1)
-                        img.paste(icon, (int(icon_x), int(icon_y)), icon)
-                    else:
-                        draw.rectangle([icon_x, icon_y, icon_x + icon_size, icon_y + icon_size], fill=(bg_color + (255,)))
-                    name_x, name_y = icon_x + icon_size + 16, icon_y + 5
-                    max_name_w = card_w - (px * 2) - icon_size - 20
-                    avg_char_w = draw.textbbox((0, 0), "A", font=name_font)[2]
-                    chars_per_line = max(1, int(max_name_w / avg_char_w))
-                    name_lines = textwrap.wrap(channel_name, width=chars_per_line)
-                    for line_idx, line in enumerate(name_lines[:3]):
-                        draw.text((name_x, name_y + (line_idx * 28)), line, font=name_font, fill=name_color)
-
-            final_img = img.convert("RGB")
+        try:
             os.makedirs(os.path.dirname(os.path.abspath(self.out_path)) or ".", exist_ok=True)
-            final_img.save(self.out_path, "JPEG", quality=92)
-            PillowImageGen._last_active_uuids = self._current_uuids
+            page_paths = []
+            for page_no, page_streams in enumerate(pages):
+                path = self.page_path(self.out_path, page_no)
+                frame = self._render_page(page_streams, page_no, len(pages))
+                with open(path, "wb") as f:
+                    f.write(frame)
+                page_paths.append(path)
+            self.page_paths = page_paths
+            if self.track_changes:
+                PillowImageGen._last_active_uuids = self._current_uuids
             return True
         except Exception as e:
             self.logger.error("Generation failed", exc_info=True)
             return False
+
+    def _build_spec(self, page_streams: list, page_no: int, page_count: int) -> dict:
+        config = TooManyStreamsConfig.get_config()
+        return {
+            "title": self.title,
+            "description": self.description,
+            "cols": self.html_cols,
+            "page_no": page_no,
+            "page_count": page_count,
+            "theme": {
+                "bg": self._hex_to_rgb(config.theme_bg_color, (15, 23, 42)),
+                "text": self._hex_to_rgb(config.theme_text_color, (248, 250, 252)),
+                "card_bg": self._hex_to_rgb(config.theme_card_bg_color, (30, 41, 59)),
+                "card_border": self._hex_to_rgb(config.theme_card_border_color, (51, 65, 85)),
+                "accent": self._hex_to_rgb(config.theme_accent_color, (56, 189, 248)),
+                "accent_text": self._hex_to_rgb(config.theme_accent_text_color, (15, 23, 42)),
+            },
+            "cards": [
+                (channel.num, channel.name, self._get_cached_logo(channel.logo_url))
+                for channel in page_streams
+            ],
+        }
+
+    def _render_page(self, page_streams: list, page_no: int, page_count: int) -> bytes:
+        spec = self._build_spec(page_streams, page_no, page_count)
+        config = TooManyStreamsConfig.get_config()
+        if config.render_backend != RENDER_BACKEND_PROCESS:
+            return render_page(spec)
+
+        worker = RenderWorker.get_instance()
+        try:
+            return worker.render(spec, timeout=config.render_timeout)
+        except TMS_RenderWorkerError as e:
+            # Most likely a bad logo: retry once without any logos so the page still renders
+            self.logger.warning(f"Render worker failed ({e}), retrying page {page_no + 1} without logos.")
+            spec["cards"] = [(num, name, None) for num, name, _ in spec["cards"]]
+            return worker.render(spec, timeout=config.render_timeout)
@@ -0,0 +1,196 @@
+"""
+Pure Pillow rendering of a single splash page from a render spec.
+
+This module must not import Django or anything from the plugin: it is also executed
+directly as the render worker process (see RenderWorker), which talks to the plugin
+over stdin/stdout using length-prefixed pickled frames.
+
+Render spec:
+    {
+        "title": str, "description": str, "cols": int,
+        "page_no": int, "page_count": int,
+        "theme": {"bg", "text", "card_bg", "card_border", "accent", "accent_text"} as RGB tuples,
+        "cards": [(channel_num, channel_name, logo_bytes or None), ...],
+    }
+"""
+import pickle
+import struct
+import sys
+import textwrap
+from io import BytesIO
+
+from PIL import Image, ImageDraw, ImageFont
+
+WIDTH, HEIGHT = 1920, 1080
+CONTENT_WIDTH = 1440
+CARD_SPACING = 24
+CARD_H, GRID_Y_START = 200, 350
+GRID_Y_END = HEIGHT - 40
+MIN_CARD_W = 200
+MAX_COLS = (CONTENT_WIDTH + CARD_SPACING) // (MIN_CARD_W + CARD_SPACING)
+ROWS_PER_PAGE = (GRID_Y_END - GRID_Y_START + CARD_SPACING) // (CARD_H + CARD_SPACING)
+
+JPEG_QUALITY = 92
+FRAME_HEADER = struct.Struct("!I")
+
+DEFAULT_THEME = {
+    "bg": (15, 23, 42),
+    "text": (248, 250, 252),
+    "card_bg": (30, 41, 59),
+    "card_border": (51, 65, 85),
+    "accent": (56, 189, 248),
+    "accent_text": (15, 23, 42),
+}
+
+_fonts = {}
+
+
+def load_font(size, bold=False):
+    if size in _fonts:
+        return _fonts[size]
+    font = None
+    for f in ["arialbd.ttf", "arial.ttf", "/usr/share/fonts/truetype/dejavu/DejaVuSans-Bold.ttf"]:
+        try:
+            font = ImageFont.truetype(f, size)
+            break
+        except Exception:
+            continue
+    _fonts[size] = font or ImageFont.load_default()
+    return _fonts[size]
+
+
+def _open_logo(data: bytes):
+    if not data:
+        return None
+    try:
+        return Image.open(BytesIO(data)).convert("RGBA")
+    except Exception:
+        return None
+
+
+def render_page(spec: dict) -> bytes:
+    """Renders one page and returns it as JPEG bytes."""
+    width, height = WIDTH, HEIGHT
+    theme = {**DEFAULT_THEME, **(spec.get("theme") or {})}
+    title, description = spec.get("title", ""), spec.get("description", "")
+    cards = spec.get("cards") or []
+    page_no, page_count = spec.get("page_no", 0), spec.get("page_count", 1)
+
+    bg_color = tuple(theme["bg"])
+    title_color = tuple(theme["text"])
+    desc_color = (148, 163, 184) # Keep secondary text static or derive? Let's keep it static for now or add config later.
+
+    card_bg = tuple(theme["card_bg"])
+    card_border = tuple(theme["card_border"])
+
+    pill_bg_color = tuple(theme["accent"])
+    pill_text_color = tuple(theme["accent_text"])
+
+    name_color = title_color # Use main text color for channel names
+    unavailable_color = (239, 68, 68)
+
+    img = Image.new('RGBA', (width, height), color=bg_color + (255,))
+    draw = ImageDraw.Draw(img)
+
+    title_font, desc_font = load_font(48, True), load_font(20)
+    name_font, pill_font = load_font(22, True), load_font(14, True)
+
+    if not cards:
+        unavailable_text = "This Channel is Unavailable"
+        bbox = draw.textbbox((0, 0), unavailable_text, font=title_font)
+        draw.text(((width - (bbox[2] - bbox[0])) / 2, (height - (bbox[3] - bbox[1])) / 2),
+                  unavailable_text, font=title_font, fill=unavailable_color)
+    else:
+        bbox = draw.textbbox((0, 0), title, font=title_font)
+        draw.text(((width - (bbox[2] - bbox[0])) / 2, 100), title, font=title_font, fill=title_color)
+
+        content_width = CONTENT_WIDTH
+        grid_margin = (width - content_width) / 2
+        wrapper = textwrap.TextWrapper(width=100)
+        desc_lines = wrapper.wrap(text=description)
+        current_y = 180
+        for line in desc_lines:
+            bbox = draw.textbbox((0, 0), line, font=desc_font)
+            draw.text(((width - (bbox[2] - bbox[0])) / 2, current_y), line, font=desc_font, fill=desc_color)
+            current_y += 32
+
+        cols, card_spacing = min(max(1, int(spec.get("cols", 5))), MAX_COLS), CARD_SPACING
+        card_w = (content_width - (card_spacing * (cols - 1))) / cols
+        card_h, grid_y_start = CARD_H, GRID_Y_START
+
+        for i, (channel_num, channel_name, logo_bytes) in enumerate(cards):
+            col, row = i % cols, i // cols
+            x = grid_margin + col * (card_w + card_spacing)
+            y = grid_y_start + row * (card_h + card_spacing)
+
+            # Alternating card background slightly?
+            # The original code had card_bg_odd/even.
+            # Let's simplify to just one card_bg for custom themes, or darken one slightly.
+            # We will stick to the single configured card color for consistency.
+
+            draw.rounded_rectangle([x, y, x + card_w, y + card_h], radius=12, fill=card_bg + (255,), outline=card_border + (255,), width=2)
+
+            px, py = 24, 24
+            pill_text = f"CH {channel_num.replace('#', '')}"
+            p_bbox = draw.textbbox((0, 0), pill_text, font=pill_font)
+            p_w, p_h = (p_bbox[2] - p_bbox[0]) + 24, (p_bbox[3] - p_bbox[1]) + 12
+            draw.rounded_rectangle([x + px, y + py, x + px + p_w, y + py + p_h], radius=6, fill=pill_bg_color + (255,))
+            draw.text((x + px + 12, y + py + 6), pill_text, font=pill_font, fill=pill_text_color)
+            icon_size = 80
+            icon_x, icon_y = x + px, y + py + p_h + 16
+            icon = _open_logo(logo_bytes)
+            if icon:
+                icon.thumbnail((icon_size, icon_size), Image.Resampling.LANCZOS)
+                draw.rounded_rectangle([icon_x, icon_y, icon_x + icon_size, icon_y + icon_size], radius=8, fill=bg_color + (255,), outline=card_border + (255,), width=1)
+                img.paste(icon, (int(icon_x), int(icon_y)), icon)
+            else:
+                draw.rectangle([icon_x, icon_y, icon_x + icon_size, icon_y + icon_size], fill=(bg_color + (255,)))
+            name_x, name_y = icon_x + icon_size + 16, icon_y + 5
+            max_name_w = card_w - (px * 2) - icon_size - 20
+            avg_char_w = draw.textbbox((0, 0), "A", font=name_font)[2]
+            chars_per_line = max(1, int(max_name_w / avg_char_w))
+            name_lines = textwrap.wrap(channel_name, width=chars_per_line)
+            for line_idx, line in enumerate(name_lines[:3]):
+                draw.text((name_x, name_y + (line_idx * 28)), line, font=name_font, fill=name_color)
+
+        if page_count > 1:
+            page_text = f"Page {page_no + 1} of {page_count}"
+            bbox = draw.textbbox((0, 0), page_text, font=desc_font)
+            draw.text(((width - (bbox[2] - bbox[0])) / 2, height - 36), page_text, font=desc_font, fill=desc_color)
+
+    out = BytesIO()
+    img.convert("RGB").save(out, "JPEG", quality=JPEG_QUALITY)
+    return out.getvalue()
+
+
+def read_frame(stream):
+    header = stream.read(FRAME_HEADER.size)
+    if len(header) < FRAME_HEADER.size:
+        return None
+    (size,) = FRAME_HEADER.unpack(header)
+    return pickle.loads(stream.read(size))
+
+
+def write_frame(stream, obj) -> None:
+    data = pickle.dumps(obj, protocol=pickle.HIGHEST_PROTOCOL)
+    stream.write(FRAME_HEADER.pack(len(data)) + data)
+    stream.flush()
+
+
+def _serve() -> None:
+    """Worker process entry point: render specs from stdin until it is closed."""
+    stdin, stdout = sys.stdin.buffer, sys.stdout.buffer
+    # Anything printed by Pillow or its plugins must not corrupt the frame stream
+    sys.stdout = sys.stderr
+    while True:
+        spec = read_frame(stdin)
+        if spec is None:
+            return
+        try:
+            write_frame(stdout, ("ok", render_page(spec)))
+        except Exception as e:
+            write_frame(stdout, ("error", f"{type(e).__name__}: {e}"))
+
+
+if __name__ == "__main__":
+    _serve()
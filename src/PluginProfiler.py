@@ -0,0 +1,189 @@
+import json
+import logging
+import os
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter
+
+from .PillowImageGen import PillowImageGen
+from .TooManyStreamsConfig import TooManyStreamsConfig
+
+logger = logging.getLogger('plugins.too_many_streams.PluginProfiler')
+
+
+class PluginProfiler:
+    """
+    On-demand profiler for the plugin's hot paths. For a bounded window it samples the
+    stacks of every thread currently inside the updater, a broadcaster or get_stream, and
+    traces allocations made by the plugin's own code during the window. Nothing is hooked
+    or traced outside that window, so caches filled earlier are reported by size instead
+    (see _cache_stats).
+
+    Samples are taken in the process that runs the action.
+    """
+
+    SAMPLE_INTERVAL_SEC = 0.01
+    DEFAULT_DURATION_SEC = 10
+    MAX_DURATION_SEC = 120
+    TOP_N = 15
+    TRACEMALLOC_FRAMES = 10
+    OUTPUT_DIR = "profiles"
+
+    # Functions whose presence on a stack assigns the sample to a code path
+    PATHS = {
+        "_image_updater_loop": "updater",
+        "_static_watch_loop": "updater",
+        "_render_variant": "updater",
+        "_broadcaster_loop": "broadcaster",
+        "_serve_stream": "broadcaster",
+        "_wrapped_get_stream": "get_stream",
+    }
+
+    _lock = threading.Lock()
+
+    @staticmethod
+    def _plugin_dir() -> str:
+        return os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+    @staticmethod
+    def _output_dir() -> str:
+        path = os.path.join(os.path.dirname(TooManyStreamsConfig.get_persistent_storage_path()), PluginProfiler.OUTPUT_DIR)
+        os.makedirs(path, exist_ok=True)
+        return path
+
+    @staticmethod
+    def _frame_label(frame) -> str:
+        code = frame.f_code
+        return f"{os.path.basename(code.co_filename)}:{code.co_name}:{frame.f_lineno}"
+
+    @staticmethod
+    def _classify(frame):
+        """Returns (path, folded stack from the path's entry point down to the leaf) or (None, None)."""
+        stack = []
+        path = None
+        while frame is not None:
+            stack.append(frame)
+            path = PluginProfiler.PATHS.get(frame.f_code.co_name)
+            if path:
+                break
+            frame = frame.f_back
+        if not path:
+            return None, None
+        return path, ";".join(PluginProfiler._frame_label(f) for f in reversed(stack))
+
+    @staticmethod
+    def _sample(duration: float, stacks: dict[str, Counter]) -> int:
+        me = threading.get_ident()
+        samples = 0
+        deadline = time.monotonic() + duration
+        while time.monotonic() < deadline:
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == me:
+                    continue
+                path, folded = PluginProfiler._classify(frame)
+                if path:
+                    stacks.setdefault(path, Counter())[folded] += 1
+            samples += 1
+            time.sleep(PluginProfiler.SAMPLE_INTERVAL_SEC)
+        return samples
+
+    @staticmethod
+    def _memory_stats(start, end, plugin_dir: str) -> dict:
+        only_plugin = [
+            tracemalloc.Filter(True, os.path.join(plugin_dir, "*")),
+            tracemalloc.Filter(False, os.path.abspath(__file__)),
+        ]
+        start = start.filter_traces(only_plugin)
+        end = end.filter_traces(only_plugin)
+        top_n = PluginProfiler.TOP_N
+        return {
+            "traced_bytes": sum(stat.size for stat in end.statistics("filename")),
+            "top_allocations": [
+                {"where": str(stat.traceback[0]), "bytes": stat.size, "count": stat.count}
+                for stat in end.statistics("lineno")[:top_n]
+            ],
+            "top_growth": [
+                {"where": str(stat.traceback[0]), "bytes_diff": stat.size_diff, "count_diff": stat.count_diff}
+                for stat in end.compare_to(start, "lineno")[:top_n]
+                if stat.size_diff
+            ],
+        }
+
+    @staticmethod
+    def _cache_stats(server) -> dict:
+        return {
+            "logo_cache": PillowImageGen.logo_cache_stats(),
+            # None when the stream server runs in another process
+            "stream_server": server.cache_stats() if server is not None else None,
+        }
+
+    @staticmethod
+    def run(duration: float = DEFAULT_DURATION_SEC, server=None) -> dict:
+        """
+        Profiles for `duration` seconds, writes the results next to the persistent config and
+        returns a summary. `server` is the StreamServer of this process, if any.
+        """
+        duration = max(1.0, min(float(duration), PluginProfiler.MAX_DURATION_SEC))
+        if not PluginProfiler._lock.acquire(blocking=False):
+            return {"status": "error", "message": "A profile is already running."}
+        try:
+            started_tracing = not tracemalloc.is_tracing()
+            if started_tracing:
+                tracemalloc.start(PluginProfiler.TRACEMALLOC_FRAMES)
+            try:
+                mem_start = tracemalloc.take_snapshot()
+                stacks: dict[str, Counter] = {}
+                samples = PluginProfiler._sample(duration, stacks)
+                mem_end = tracemalloc.take_snapshot()
+            finally:
+                if started_tracing:
+                    tracemalloc.stop()
+            memory = PluginProfiler._memory_stats(mem_start, mem_end, PluginProfiler._plugin_dir())
+        finally:
+            PluginProfiler._lock.release()
+
+        summary = {
+            "duration_sec": duration,
+            "samples": samples,
+            "sample_interval_sec": PluginProfiler.SAMPLE_INTERVAL_SEC,
+            "paths": {},
+            "caches": PluginProfiler._cache_stats(server),
+            # Only what was allocated while profiling, not what the caches already held
+            "allocations_during_window": memory,
+        }
+        for path, counter in stacks.items():
+            total = sum(counter.values())
+            leaves = Counter()
+            for folded, count in counter.items():
+                leaves[folded.rsplit(";", 1)[-1]] += count
+            summary["paths"][path] = {
+                "samples": total,
+                # Share of sampling ticks in which some thread was on this path
+                "busy_pct": round(100 * total / max(1, samples), 1),
+                "top_functions": [
+                    {"where": where, "samples": count, "pct": round(100 * count / total, 1)}
+                    for where, count in leaves.most_common(PluginProfiler.TOP_N)
+                ],
+                "top_stacks": [
+                    {"stack": folded, "samples": count}
+                    for folded, count in counter.most_common(PluginProfiler.TOP_N)
+                ],
+            }
+
+        # Full results: a JSON summary plus folded stacks (flamegraph.pl / speedscope input)
+        stamp = time.strftime("%Y%m%d-%H%M%S")
+        out_dir = PluginProfiler._output_dir()
+        folded_path = os.path.join(out_dir, f"profile-{stamp}.folded")
+        summary_path = os.path.join(out_dir, f"profile-{stamp}.json")
+        with open(folded_path, "w") as f:
+            for path, counter in stacks.items():
+                for folded, count in counter.items():
+                    f.write(f"{path};{folded} {count}\n")
+        summary["files"] = {"summary": summary_path, "folded_stacks": folded_path}
+        with open(summary_path, "w") as f:
+            json.dump(summary, f, indent=4)
+
+        logger.info(f"Profile written to {summary_path}")
+        return summary
@@ -0,0 +1,105 @@
+import logging
+import random
+from typing import NamedTuple, Optional
+
+logger = logging.getLogger('plugins.too_many_streams.ProfileSelector')
+
+STRATEGY_FIRST_FIT = "first_fit"
+STRATEGY_LEAST_LOADED = "least_loaded"
+STRATEGY_WEIGHTED = "weighted"
+STRATEGY_STICKY = "sticky"
+STRATEGIES = (STRATEGY_FIRST_FIT, STRATEGY_LEAST_LOADED, STRATEGY_WEIGHTED, STRATEGY_STICKY)
+
+
+class Candidate(NamedTuple):
+    stream_id: int
+    profile_id: int
+    max_streams: int
+    connections: int = 0
+
+    @property
+    def unlimited(self) -> bool:
+        return self.max_streams == 0
+
+    @property
+    def has_capacity(self) -> bool:
+        return self.unlimited or self.connections < self.max_streams
+
+    @property
+    def utilization(self) -> float:
+        return 0.0 if self.unlimited else self.connections / self.max_streams
+
+    @property
+    def remaining(self) -> int:
+        return self.max_streams - self.connections
+
+
+class ProfileSelector:
+    """
+    Picks the (stream, M3U profile) pair a channel should be served from. Candidates come
+    in channel stream order (default profile first per account) with their connection
+    counters already loaded, so every strategy works from a single batched Redis read.
+    """
+
+    STICKY_KEY = "tms:sticky_profile:{channel_id}"
+    STICKY_TTL_SEC = 24 * 3600
+
+    @staticmethod
+    def load_connections(redis_client, candidates: list[Candidate]) -> list[Candidate]:
+        """Fills in every candidate's profile_connections counter with one MGET."""
+        profile_ids = list(dict.fromkeys(c.profile_id for c in candidates))
+        if not profile_ids:
+            return candidates
+        values = redis_client.mget([f"profile_connections:{pid}" for pid in profile_ids])
+        counts = {}
+        for pid, value in zip(profile_ids, values):
+            try:
+                counts[pid] = int(value or 0)
+            except (TypeError, ValueError):
+                counts[pid] = 0
+        return [c._replace(connections=counts[c.profile_id]) for c in candidates]
+
+    @staticmethod
+    def select(strategy: str, candidates: list[Candidate], channel_id=None, redis_client=None) -> Optional[Candidate]:
+        available = [c for c in candidates if c.has_capacity]
+        if not available:
+            return None
+
+        if strategy == STRATEGY_LEAST_LOADED:
+            # min() keeps the first of equally loaded candidates, i.e. channel stream order
+            return min(available, key=lambda c: c.utilization)
+        if strategy == STRATEGY_WEIGHTED:
+            return ProfileSelector._select_weighted(available)
+        if strategy == STRATEGY_STICKY:
+            return ProfileSelector._select_sticky(available, channel_id, redis_client)
+        if strategy != STRATEGY_FIRST_FIT:
+            logger.warning(f"Unknown profile selection strategy '{strategy}', using {STRATEGY_FIRST_FIT}.")
+        return available[0]
+
+    @staticmethod
+    def _select_weighted(available: list[Candidate]) -> Candidate:
+        limited = [c.remaining for c in available if not c.unlimited]
+        # Unlimited profiles weigh as much as the roomiest limited one
+        unlimited_weight = max(limited, default=1)
+        weights = [unlimited_weight if c.unlimited else c.remaining for c in available]
+        return random.choices(available, weights=weights, k=1)[0]
+
+    @staticmethod
+    def _select_sticky(available: list[Candidate], channel_id, redis_client) -> Candidate:
+        """
+        Keeps a channel on the profile it used last, as long as that profile has room.
+        get_stream() carries no client identity, so stickiness is per channel.
+        """
+        key = ProfileSelector.STICKY_KEY.format(channel_id=channel_id)
+        try:
+            last = redis_client.get(key) if redis_client and channel_id is not None else None
+            last = int(last) if last else None
+        except (TypeError, ValueError):
+            last = None
+
+        choice = next((c for c in available if c.profile_id == last), None)
+        if choice is None:
+            choice = min(available, key=lambda c: c.utilization)
+        if redis_client and channel_id is not None:
+            redis_client.set(key, choice.profile_id, ex=ProfileSelector.STICKY_TTL_SEC)
+        return choice
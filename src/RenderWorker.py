@@ -0,0 +1,153 @@
+import logging
+import os
+import pickle
+import select
+import shutil
+import subprocess
+import sys
+import threading
+import time
+from collections import deque
+
+from .PillowRenderer import FRAME_HEADER, write_frame
+from .exceptions import TMS_RenderWorkerError
+
+logger = logging.getLogger('plugins.too_many_streams.RenderWorker')
+
+RENDERER_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "PillowRenderer.py")
+
+
+class RenderWorker:
+    """
+    Runs PillowRenderer in a dedicated Python process so Pillow and JPEG work never
+    competes with the proxy threads for the Dispatcharr GIL. The process is started
+    lazily, reused across renders and replaced after any crash or timeout. The tail of
+    the worker's stderr is kept so a failing worker (e.g. a Python without Pillow) can
+    be diagnosed from the logs and stats.
+    """
+
+    STDERR_TAIL_LINES = 20
+
+    _instance = None
+    _instance_lock = threading.Lock()
+
+    def __init__(self):
+        self.process = None
+        self.lock = threading.Lock()
+        self.stderr_tail: deque = deque(maxlen=self.STDERR_TAIL_LINES)
+        self._stderr_thread = None
+        self.renders = 0
+        self.failures = 0
+        self.last_error = None
+
+    @classmethod
+    def get_instance(cls) -> "RenderWorker":
+        with cls._instance_lock:
+            if cls._instance is None:
+                cls._instance = cls()
+            return cls._instance
+
+    @staticmethod
+    def _python_bin() -> str:
+        # Under uWSGI/gunicorn sys.executable may be the server binary, not Python
+        if os.path.basename(sys.executable or "").startswith("python"):
+            return sys.executable
+        # The interpreter of Dispatcharr's own environment, which has Pillow
+        for name in ("python", "python3"):
+            path = os.path.join(sys.prefix, "bin", name)
+            if os.access(path, os.X_OK):
+                return path
+        return shutil.which("python3") or shutil.which("python") or sys.executable
+
+    @staticmethod
+    def _drain_stderr(pipe, tail: deque) -> None:
+        try:
+            for line in iter(pipe.readline, b""):
+                tail.append(line.decode(errors="replace").rstrip())
+        except Exception:
+            pass
+
+    def _ensure_process(self) -> subprocess.Popen:
+        if self.process and self.process.poll() is None:
+            return self.process
+        if self.process:
+            logger.warning(f"Render worker exited with {self.process.returncode}, starting a new one.")
+        self.process = subprocess.Popen(
+            [self._python_bin(), RENDERER_SCRIPT],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+        )
+        self.stderr_tail = deque(maxlen=self.STDERR_TAIL_LINES)
+        self._stderr_thread = threading.Thread(
+            target=self._drain_stderr, args=(self.process.stderr, self.stderr_tail), daemon=True, name="TMS_RenderWorkerStderr",
+        )
+        self._stderr_thread.start()
+        return self.process
+
+    def _kill(self) -> None:
+        proc, self.process = self.process, None
+        if not proc:
+            return
+        try:
+            proc.kill()
+            proc.wait(timeout=1)
+        except Exception as e:
+            logger.warning(f"Error killing render worker: {e}")
+        if self._stderr_thread:
+            self._stderr_thread.join(timeout=1)
+
+    def _fail(self, error: TMS_RenderWorkerError) -> TMS_RenderWorkerError:
+        self._kill()
+        self.failures += 1
+        self.last_error = str(error)
+        if self.stderr_tail:
+            logger.error("Render worker stderr:\n" + "\n".join(self.stderr_tail))
+        return error
+
+    @staticmethod
+    def _read_exact(fd: int, size: int, deadline: float) -> bytes:
+        data = bytearray()
+        while len(data) < size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise TMS_RenderWorkerError("Render timed out")
+            ready, _, _ = select.select([fd], [], [], remaining)
+            if not ready:
+                continue
+            chunk = os.read(fd, size - len(data))
+            if not chunk:
+                raise TMS_RenderWorkerError("Render worker died")
+            data.extend(chunk)
+        return bytes(data)
+
+    def render(self, spec: dict, timeout: float) -> bytes:
+        """Renders one page in the worker and returns JPEG bytes."""
+        with self.lock:
+            try:
+                proc = self._ensure_process()
+                write_frame(proc.stdin, spec)
+                deadline = time.monotonic() + timeout
+                fd = proc.stdout.fileno()
+                (size,) = FRAME_HEADER.unpack(self._read_exact(fd, FRAME_HEADER.size, deadline))
+                status, payload = pickle.loads(self._read_exact(fd, size, deadline))
+            except TMS_RenderWorkerError as e:
+                raise self._fail(e)
+            except (OSError, ValueError, pickle.PickleError) as e:
+                raise self._fail(TMS_RenderWorkerError(f"Render worker failed: {e}"))
+
+        if status != "ok":
+            self.last_error = str(payload)
+            raise TMS_RenderWorkerError(payload)
+        self.renders += 1
+        return payload
+
+    def stats(self) -> dict:
+        return {
+            "python": self._python_bin(),
+            "running": bool(self.process and self.process.poll() is None),
+            "renders": self.renders,
+            "failures": self.failures,
+            "last_error": self.last_error,
+            "stderr_tail": list(self.stderr_tail),
+        }
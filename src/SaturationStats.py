@@ -0,0 +1,201 @@
+import logging
+import re
+import threading
+import time
+
+from core.utils import RedisClient
+
+logger = logging.getLogger('plugins.too_many_streams.SaturationStats')
+
+
+class SaturationStats:
+    """
+    Capacity-planning counters kept in Redis as bucketed hashes. Every sample is written
+    to its minute bucket and rolled up into its hour bucket in the same pipeline, so
+    minute detail expires after a few hours while hourly totals are kept for weeks.
+
+    Fields per bucket:
+      sat:<channel_id>   times the channel found every profile at capacity
+      satp:<profile_id>  times the profile was full when a channel saturated
+      view:<channel_id>  viewer-seconds spent on the splash instead of the channel
+      cap:<profile_id>   seconds the profile spent at its connection limit
+    """
+
+    MINUTE_KEY = "tms:stats:m:{ts}"
+    HOUR_KEY = "tms:stats:h:{ts}"
+    MINUTE_RETENTION_SEC = 3 * 3600
+    HOUR_RETENTION_SEC = 30 * 24 * 3600
+    SAMPLE_SEC = 15
+    PROFILE_REFRESH_SEC = 60
+    REPORT_TOP_N = 20
+
+    _sampler = None
+
+    @staticmethod
+    def _record(fields: dict, now: float = None) -> None:
+        """Adds fields to the current minute and hour buckets in one round trip."""
+        fields = {k: v for k, v in fields.items() if v}
+        if not fields:
+            return
+        now = time.time() if now is None else now
+        minute_key = SaturationStats.MINUTE_KEY.format(ts=int(now // 60) * 60)
+        hour_key = SaturationStats.HOUR_KEY.format(ts=int(now // 3600) * 3600)
+        try:
+            pipe = RedisClient.get_client().pipeline(transaction=False)
+            for key, ttl in ((minute_key, SaturationStats.MINUTE_RETENTION_SEC), (hour_key, SaturationStats.HOUR_RETENTION_SEC)):
+                for field, amount in fields.items():
+                    pipe.hincrby(key, field, int(round(amount)))
+                pipe.expire(key, ttl)
+            pipe.execute()
+        except Exception as e:
+            logger.debug(f"Could not record stats: {e}")
+
+    @staticmethod
+    def record_saturation(channel_id, profile_ids=()) -> None:
+        fields = {f"sat:{channel_id}": 1}
+        fields.update({f"satp:{pid}": 1 for pid in set(profile_ids)})
+        SaturationStats._record(fields)
+
+    @staticmethod
+    def start_sampler() -> None:
+        """Samples splash viewers and full profiles. Run in the process that owns the stream server only."""
+        if SaturationStats._sampler is None:
+            SaturationStats._sampler = threading.Thread(target=SaturationStats._sampler_loop, daemon=True, name="TMS_StatsSampler")
+            SaturationStats._sampler.start()
+
+    @staticmethod
+    def _sampler_loop():
+        profiles = {}
+        profiles_loaded_at = 0.0
+        last = time.monotonic()
+        while True:
+            time.sleep(SaturationStats.SAMPLE_SEC)
+            now = time.monotonic()
+            elapsed, last = now - last, now
+            try:
+                if now - profiles_loaded_at > SaturationStats.PROFILE_REFRESH_SEC:
+                    profiles = SaturationStats._limited_profiles()
+                    profiles_loaded_at = now
+                fields = {}
+                for channel_id, viewers in SaturationStats._splash_viewers().items():
+                    fields[f"view:{channel_id}"] = viewers * elapsed
+                for profile_id in SaturationStats._full_profiles(profiles):
+                    fields[f"cap:{profile_id}"] = elapsed
+                SaturationStats._record(fields)
+            except Exception as e:
+                logger.error(f"Stats sampling failed: {e}")
+
+    @staticmethod
+    def _limited_profiles() -> dict[int, int]:
+        """profile_id -> max_streams for every active profile with a connection limit."""
+        from apps.m3u.models import M3UAccountProfile
+        return dict(
+            M3UAccountProfile.objects.filter(is_active=True, max_streams__gt=0).values_list('id', 'max_streams')
+        )
+
+    @staticmethod
+    def _full_profiles(profiles: dict[int, int]) -> list[int]:
+        if not profiles:
+            return []
+        ids = list(profiles)
+        values = RedisClient.get_client().mget([f"profile_connections:{pid}" for pid in ids])
+        return [pid for pid, value in zip(ids, values) if int(value or 0) >= profiles[pid]]
+
+    @staticmethod
+    def _splash_viewers() -> dict[int, int]:
+        """channel_id -> viewers for channels the proxy is currently serving the splash on."""
+        from apps.channels.models import Channel
+        from apps.proxy.ts_proxy.channel_status import ChannelStatus
+        from .TooManyStreamsConfig import TooManyStreamsConfig
+
+        redis_client = RedisClient.get_client()
+        uuids = []
+        for key in redis_client.scan_iter(match="ts_proxy:channel:*:metadata"):
+            m = re.search(r"ts_proxy:channel:(.*):metadata", key.decode("utf-8") if isinstance(key, bytes) else key)
+            if m:
+                uuids.append(m.group(1))
+        if not uuids:
+            return {}
+        # One pipelined read of every channel's URL; the full status is only looked up for splash channels
+        pipe = redis_client.pipeline(transaction=False)
+        for uuid in uuids:
+            pipe.hget(f"ts_proxy:channel:{uuid}:metadata", "url")
+        on_splash = {}
+        for uuid, url in zip(uuids, pipe.execute()):
+            if not TooManyStreamsConfig.is_stream_url(url.decode() if isinstance(url, bytes) else url):
+                continue
+            info = ChannelStatus.get_basic_channel_info(uuid) or {}
+            on_splash[uuid] = int(info.get("client_count") or 1)
+        if not on_splash:
+            return {}
+        return {
+            channel_id: on_splash[str(uuid)]
+            for uuid, channel_id in Channel.objects.filter(uuid__in=list(on_splash)).values_list('uuid', 'id')
+        }
+
+    @staticmethod
+    def _read_buckets(key_format: str, start: int, end: int, step: int) -> list[tuple[int, dict]]:
+        timestamps = list(range(start, end + 1, step))
+        pipe = RedisClient.get_client().pipeline(transaction=False)
+        for ts in timestamps:
+            pipe.hgetall(key_format.format(ts=ts))
+        buckets = []
+        for ts, raw in zip(timestamps, pipe.execute()):
+            decoded = {
+                (k.decode() if isinstance(k, bytes) else k): int(v)
+                for k, v in (raw or {}).items()
+            }
+            buckets.append((ts, decoded))
+        return buckets
+
+    @staticmethod
+    def _top(totals: dict, prefix: str, names: dict) -> list[dict]:
+        items = sorted(
+            ((int(field[len(prefix):]), value) for field, value in totals.items() if field.startswith(prefix)),
+            key=lambda item: item[1], reverse=True,
+        )[:SaturationStats.REPORT_TOP_N]
+        return [{"id": id_, "name": names.get(id_), "value": value} for id_, value in items]
+
+    @staticmethod
+    def get_report(hours: int = 24) -> dict:
+        """Aggregated saturation report over the last `hours` hours, plus per-minute detail for the last hour."""
+        from apps.channels.models import Channel
+        from apps.m3u.models import M3UAccountProfile
+
+        hours = max(1, min(int(hours), SaturationStats.HOUR_RETENTION_SEC // 3600))
+        now = int(time.time())
+        current_hour = now // 3600 * 3600
+        hourly = SaturationStats._read_buckets(SaturationStats.HOUR_KEY, current_hour - (hours - 1) * 3600, current_hour, 3600)
+        current_minute = now // 60 * 60
+        minutes = SaturationStats._read_buckets(SaturationStats.MINUTE_KEY, current_minute - 59 * 60, current_minute, 60)
+
+        totals = {}
+        by_hour_of_day = [0] * 24
+        for ts, bucket in hourly:
+            for field, value in bucket.items():
+                totals[field] = totals.get(field, 0) + value
+            by_hour_of_day[time.localtime(ts).tm_hour] += sum(v for f, v in bucket.items() if f.startswith("sat:"))
+
+        channel_ids = {int(f.split(":", 1)[1]) for f in totals if f.startswith(("sat:", "view:"))}
+        profile_ids = {int(f.split(":", 1)[1]) for f in totals if f.startswith(("satp:", "cap:"))}
+        channel_names = dict(Channel.objects.filter(id__in=channel_ids).values_list('id', 'name'))
+        profile_names = dict(M3UAccountProfile.objects.filter(id__in=profile_ids).values_list('id', 'name'))
+
+        return {
+            "hours": hours,
+            "saturation_events": sum(v for f, v in totals.items() if f.startswith("sat:")),
+            "splash_viewer_seconds": sum(v for f, v in totals.items() if f.startswith("view:")),
+            "top_saturated_channels": SaturationStats._top(totals, "sat:", channel_names),
+            "top_splash_channels": SaturationStats._top(totals, "view:", channel_names),
+            "profiles_full_at_saturation": SaturationStats._top(totals, "satp:", profile_names),
+            "profile_seconds_at_capacity": SaturationStats._top(totals, "cap:", profile_names),
+            "saturation_by_hour_of_day": by_hour_of_day,
+            "last_hour_by_minute": [
+                {
+                    "ts": ts,
+                    "saturation_events": sum(v for f, v in bucket.items() if f.startswith("sat:")),
+                    "splash_viewer_seconds": sum(v for f, v in bucket.items() if f.startswith("view:")),
+                }
+                for ts, bucket in minutes
+            ],
+        }
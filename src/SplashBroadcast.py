@@ -0,0 +1,199 @@
+import logging
+import threading
+import time
+from collections import OrderedDict
+from hashlib import md5
+
+from .StreamClient import TS_PACKET_SIZE
+from .TooManyStreamsConfig import TooManyStreamsConfig
+from .TSSegment import TSRestamper
+
+logger = logging.getLogger('plugins.too_many_streams.SplashBroadcast')
+
+
+class SplashBroadcast:
+    """
+    One splash output: the default splash or a personalized variant. Holds the page
+    rotation, the viewers watching it and the thread that paces the pages out to them,
+    so every viewer of the same splash shares a single broadcaster.
+    """
+
+    CHUNK_PACKETS = 7 * 16
+    HLS_WINDOW = 5
+    HLS_CACHE_SIZE = 10
+
+    def __init__(self, name: str, group_id: int = None, channel_id: int = None):
+        self.name = name
+        self.group_id = group_id
+        self.channel_id = channel_id
+
+        self.pages = []
+        self.pages_lock = threading.Lock()
+        self.clients = []
+        self.clients_lock = threading.Lock()
+        # Serialises renders of this splash; inputs_key is the content it was last rendered from
+        self.render_lock = threading.Lock()
+        self.inputs_key = None
+
+        # Immutable HLS segments by media sequence number: seq -> (data, etag)
+        self._hls_segments: OrderedDict[int, tuple[bytes, str]] = OrderedDict()
+        self._hls_lock = threading.Lock()
+
+        self.last_used = time.monotonic()
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def set_pages(self, segments: list) -> None:
+        with self.pages_lock:
+            self.pages = list(segments)
+
+    def page_keys(self) -> list[str]:
+        with self.pages_lock:
+            return [seg.key for seg in self.pages]
+
+    def page_at(self, ts: float):
+        """The page in rotation at wall-clock time ts."""
+        with self.pages_lock:
+            pages = self.pages
+        if not pages:
+            return None
+        interval = max(pages[0].duration, TooManyStreamsConfig.get_config().carousel_interval)
+        return pages[int(ts // interval) % len(pages)]
+
+    def current_page(self):
+        return self.page_at(time.time())
+
+    def touch(self) -> None:
+        self.last_used = time.monotonic()
+
+    def _segment_duration(self) -> float:
+        with self.pages_lock:
+            return self.pages[0].duration if self.pages else 0
+
+    def hls_window(self) -> list[int]:
+        """
+        Media sequence numbers of the live playlist. Sequence n covers wall-clock time
+        [n * duration, (n + 1) * duration) and is materialized the first time it is listed,
+        after which its bytes never change.
+        """
+        duration = self._segment_duration()
+        if not duration:
+            return []
+        current = int(time.time() // duration)
+        window = list(range(current - self.HLS_WINDOW + 1, current + 1))
+        for seq in window:
+            self.hls_segment(seq, create=True)
+        return window
+
+    def hls_segment(self, seq: int, create: bool = False):
+        """Returns (data, etag) for a materialized segment, or None."""
+        with self._hls_lock:
+            cached = self._hls_segments.get(seq)
+            if cached or not create:
+                return cached
+
+            segment = self.page_at(seq * self._segment_duration())
+            if segment is None:
+                return None
+            # Timestamps derive from the sequence number, so consecutive segments play back to back
+            data = TSRestamper(clock=TSRestamper.START_CLOCK + seq * segment.duration_90k).restamp(segment)
+            etag = f'"{self.name}-{seq}-{md5(data).hexdigest()[:16]}"'
+            self._hls_segments[seq] = (data, etag)
+            while len(self._hls_segments) > self.HLS_CACHE_SIZE:
+                self._hls_segments.popitem(last=False)
+            return self._hls_segments[seq]
+
+    def hls_cache_stats(self) -> dict:
+        with self._hls_lock:
+            return {"segments": len(self._hls_segments), "bytes": sum(len(data) for data, _ in self._hls_segments.values())}
+
+    def hls_playlist(self, segment_url) -> str:
+        window = self.hls_window()
+        duration = self._segment_duration()
+        lines = [
+            "#EXTM3U",
+            "#EXT-X-VERSION:3",
+            f"#EXT-X-TARGETDURATION:{max(1, int(round(duration)))}",
+            f"#EXT-X-MEDIA-SEQUENCE:{window[0] if window else 0}",
+        ]
+        for seq in window:
+            lines.append(f"#EXTINF:{duration:.3f},")
+            lines.append(segment_url(seq))
+        return "\n".join(lines) + "\n"
+
+    def add_client(self, client) -> None:
+        with self.clients_lock:
+            self.clients.append(client)
+        self.last_used = time.monotonic()
+
+    def remove_client(self, client) -> None:
+        with self.clients_lock:
+            if client in self.clients:
+                self.clients.remove(client)
+        self.last_used = time.monotonic()
+
+    def client_count(self) -> int:
+        with self.clients_lock:
+            return len(self.clients)
+
+    def idle_for(self) -> float:
+        """Seconds since the last viewer left, or 0 while anyone is watching."""
+        if self.client_count():
+            return 0.0
+        return time.monotonic() - self.last_used
+
+    def get_client_stats(self) -> list[dict]:
+        with self.clients_lock:
+            return [{**c.stats(), "splash": self.name} for c in self.clients]
+
+    def start(self) -> None:
+        self._thread = threading.Thread(target=self._broadcaster_loop, daemon=True, name=f"TMS_Broadcaster_{self.name}")
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stopped.set()
+
+    def _broadcast(self, buf: bytes):
+        with self.clients_lock:
+            clients = self.clients[:]
+        for client in clients:
+            client.offer(buf)
+
+    def _broadcaster_loop(self):
+        logger.info(f"Starting Broadcaster loop ({self.name})")
+        restamper = TSRestamper()
+        chunk_size = TS_PACKET_SIZE * self.CHUNK_PACKETS
+        next_send = time.monotonic()
+        while not self._stopped.is_set():
+            # Optimization: Pause if no clients
+            with self.clients_lock:
+                has_clients = len(self.clients) > 0
+
+            if not has_clients:
+                time.sleep(1)
+                next_send = time.monotonic()
+                continue
+
+            segment = self.current_page()
+            if segment is None:
+                time.sleep(0.5)
+                continue
+
+            try:
+                # Replay the cached clip in real time with timestamps continuing from the last one
+                data = restamper.restamp(segment)
+                chunks = [data[i:i + chunk_size] for i in range(0, len(data), chunk_size)]
+                step = segment.duration / max(1, len(chunks))
+                for chunk in chunks:
+                    delay = next_send - time.monotonic()
+                    if delay > 0:
+                        time.sleep(delay)
+                    elif delay < -segment.duration:
+                        # Fell far behind (e.g. host suspended), don't burst to catch up
+                        next_send = time.monotonic()
+                    self._broadcast(chunk)
+                    next_send += step
+            except Exception as e:
+                logger.error(f"Broadcaster error ({self.name}): {e}")
+                time.sleep(1)
+        logger.info(f"Broadcaster loop stopped ({self.name})")
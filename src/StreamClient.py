@@ -0,0 +1,151 @@
+import logging
+import queue
+import threading
+import time
+
+logger = logging.getLogger('plugins.too_many_streams.StreamClient')
+
+TS_PACKET_SIZE = 188
+TS_SYNC_BYTE = 0x47
+
+POLICY_SKIP = "skip"
+POLICY_DISCONNECT = "disconnect"
+
+
+def find_keyframe_offset(buf: bytes) -> int:
+    """
+    Returns the offset of the first video TS packet flagged as a random access point
+    (i.e. the start of a keyframe) in a packet-aligned buffer, or -1 if there is none.
+    """
+    for i in range(0, len(buf) - TS_PACKET_SIZE + 1, TS_PACKET_SIZE):
+        if buf[i] != TS_SYNC_BYTE or not buf[i + 1] & 0x40:
+            continue
+        afc = (buf[i + 3] >> 4) & 0x3
+        if not afc & 0x2 or buf[i + 4] == 0 or not buf[i + 5] & 0x40:
+            continue
+        # Only accept video PES packets (stream_id 0xE0-0xEF), audio frames are flagged too
+        payload = i + 5 + buf[i + 4]
+        if not afc & 0x1 or payload + 4 > i + TS_PACKET_SIZE:
+            continue
+        if buf[payload:payload + 3] == b"\x00\x00\x01" and 0xE0 <= buf[payload + 3] <= 0xEF:
+            return i
+    return -1
+
+
+class StreamClient:
+    """
+    A single viewer of the broadcast. Holds the viewer's chunk queue, applies the
+    slow-viewer policy when the queue backs up and keeps per-client lag statistics.
+    """
+
+    QUEUE_SIZE = 50
+
+    def __init__(self, address: str, policy: str = POLICY_SKIP, max_lag_sec: float = 10):
+        self.address = address
+        self.policy = policy if policy in (POLICY_SKIP, POLICY_DISCONNECT) else POLICY_SKIP
+        self.max_lag_sec = max_lag_sec
+        self.queue = queue.Queue(maxsize=self.QUEUE_SIZE)
+        self.connected_at = time.time()
+        self.evicted = False
+
+        # New viewers start on a keyframe so their decoder never sees a partial GOP
+        self._awaiting_keyframe = True
+        self._full_since = None
+        self._lock = threading.Lock()
+
+        # Statistics
+        self.bytes_sent = 0
+        self.chunks_sent = 0
+        self.chunks_dropped = 0
+        self.skips = 0
+        self.current_lag = 0.0
+        self.max_lag = 0.0
+
+    def offer(self, buf: bytes) -> None:
+        """Called by the broadcaster for every chunk. Never blocks."""
+        with self._lock:
+            if self.evicted:
+                return
+
+            if self._awaiting_keyframe:
+                offset = find_keyframe_offset(buf)
+                if offset < 0:
+                    self.chunks_dropped += 1
+                    return
+                buf = buf[offset:]
+                self._awaiting_keyframe = False
+
+            try:
+                self.queue.put_nowait((time.time(), buf))
+                # Only a viewer that has drained its backlog counts as caught up
+                if self.queue.qsize() <= 1:
+                    self._full_since = None
+                return
+            except queue.Full:
+                pass
+
+            now = time.time()
+            self.chunks_dropped += 1
+            # The dropped chunk leaves a hole in the GOP, resume from the next keyframe
+            self._awaiting_keyframe = True
+            if self._full_since is None:
+                self._full_since = now
+            behind = max(now - self._head_timestamp(now), now - self._full_since)
+            self._record_lag(behind)
+
+            if self.policy == POLICY_SKIP:
+                # Throw away the backlog and resume from the next keyframe
+                self._drain()
+                self._full_since = None
+                self.skips += 1
+                logger.debug(f"Client {self.address} fell behind, skipping to next keyframe")
+            elif behind >= self.max_lag_sec:
+                self._drain()
+                self.evicted = True
+                self.queue.put_nowait(None)
+                logger.info(f"Evicting client {self.address}: {behind:.1f}s behind")
+
+    def get(self, timeout: float = None):
+        """Returns the next chunk for this viewer, or None once it has been evicted."""
+        item = self.queue.get(timeout=timeout)
+        if item is None:
+            return None
+        ts, buf = item
+        self._record_lag(time.time() - ts)
+        return buf
+
+    def record_sent(self, n: int) -> None:
+        self.bytes_sent += n
+        self.chunks_sent += 1
+
+    def _record_lag(self, lag: float) -> None:
+        self.current_lag = lag
+        self.max_lag = max(self.max_lag, lag)
+
+    def _head_timestamp(self, default: float) -> float:
+        """When the oldest queued chunk was offered."""
+        with self.queue.mutex:
+            head = self.queue.queue[0] if self.queue.queue else None
+        return head[0] if head else default
+
+    def _drain(self) -> None:
+        while True:
+            try:
+                self.queue.get_nowait()
+            except queue.Empty:
+                return
+
+    def stats(self) -> dict:
+        return {
+            "address": self.address,
+            "policy": self.policy,
+            "connected_sec": round(time.time() - self.connected_at, 1),
+            "queue_depth": self.queue.qsize(),
+            "bytes_sent": self.bytes_sent,
+            "chunks_sent": self.chunks_sent,
+            "chunks_dropped": self.chunks_dropped,
+            "skips": self.skips,
+            "current_lag_sec": round(self.current_lag, 2),
+            "max_lag_sec": round(self.max_lag, 2),
+            "evicted": self.evicted,
+        }
@@ -1,31 +1,157 @@
+import json
 import logging
 import os
+import queue
+import select
 import shutil
-import subprocess
+import socket
+import socketserver
 import threading
 import time
-import queue
+from collections import OrderedDict
+from hashlib import md5
 from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+from PIL import Image
+
+from apps.channels.models import Channel, ChannelGroup
 
+from .AdmissionControl import AdmissionControl
+from .EncoderWatchdog import EncoderWatchdog
 from .PillowImageGen import PillowImageGen
+from .SplashBroadcast import SplashBroadcast
+from .StreamClient import StreamClient
 from .TooManyStreamsConfig import TooManyStreamsConfig
+from .TSSegment import TSSegment
 
 logger = logging.getLogger('plugins.too_many_streams.StreamServer')
 
+HLS_PREFIX = "/hls/"
+HLS_PLAYLIST_MAX_AGE = 1
+
+
+class AdmissionHTTPServer(ThreadingHTTPServer):
+    """
+    ThreadingHTTPServer that runs admission control in the accept loop, so a rejected
+    connection gets a fast 503 without ever costing a handler thread or a viewer queue.
+    """
+
+    # Allow reuse address to prevent "Address already in use" on quick restarts
+    allow_reuse_address = True
+    RETRY_AFTER_SEC = 5
+
+    def __init__(self, server_address, handler_class, admission: AdmissionControl):
+        self.admission = admission
+        super().__init__(server_address, handler_class)
+
+    @staticmethod
+    def client_ip(client_address) -> str:
+        # Unix socket peers have no address and are always the local proxy
+        return client_address[0] if isinstance(client_address, tuple) else "127.0.0.1"
+
+    def process_request(self, request, client_address):
+        ip = self.client_ip(client_address)
+        if not self.admission.try_admit(ip):
+            self._reject(request)
+            return
+        try:
+            super().process_request(request, client_address)
+        except Exception:
+            self.admission.release(ip)
+            raise
+
+    def process_request_thread(self, request, client_address):
+        try:
+            super().process_request_thread(request, client_address)
+        finally:
+            self.admission.release(self.client_ip(client_address))
+
+    def _reject(self, request):
+        try:
+            # Drain what already arrived so closing doesn't turn into a reset that hides the 503
+            request.setblocking(False)
+            try:
+                request.recv(65536)
+            except OSError:
+                pass
+            request.setblocking(True)
+            request.settimeout(1)
+            request.sendall(
+                b"HTTP/1.0 503 Service Unavailable\r\n"
+                + f"Retry-After: {self.RETRY_AFTER_SEC}\r\n".encode()
+                + b"Content-Length: 0\r\nConnection: close\r\n\r\n"
+            )
+        except OSError:
+            pass
+        finally:
+            self.shutdown_request(request)
+
+
+class AdmissionUnixHTTPServer(AdmissionHTTPServer):
+    """The same server on a Unix domain socket, for the Dispatcharr proxy in other local processes."""
+
+    address_family = socket.AF_UNIX
+
+    def server_bind(self):
+        if os.path.exists(self.server_address):
+            os.unlink(self.server_address)
+        socketserver.TCPServer.server_bind(self)
+        self.server_name = "localhost"
+        self.server_port = 0
+
+
 class StreamServer:
+    # Each page is encoded once into a short clip that is replayed until the page changes
+    SEGMENT_SECONDS = 2
+    ENCODE_TIMEOUT_SEC = 60
+    SEGMENT_CACHE_DIR = "tms_segment_cache"
+    MANIFEST_FILE = "carousel.json"
+    STATIC_POLL_SEC = 30
+    VARIANT_DIR = "variants"
+    VARIANT_IDLE_SEC = 300
+    MAX_VARIANTS = 32
+    KNOWN_IDS_TTL_SEC = 30
+
     def __init__(self, host, port, image_path=None, refresh_signal=None):
         self.host = host
         self.port = port
-        self.image_path = image_path or os.path.join(os.path.dirname(__file__), "..", "img", "too_many_streams2.jpg")
+        # A user supplied image switches the server into static mode (see _start_static)
+        self.static_image_path = image_path
+        self.image_path = os.path.join(os.path.dirname(__file__), "..", "img", "too_many_streams2.jpg")
         self.refresh_signal = refresh_signal or threading.Event()
         
-        self.process = None
-        self.clients = []
-        self.clients_lock = threading.Lock()
-        self.process_lock = threading.Lock()
+        self.default = SplashBroadcast("default")
+        # Personalized splashes keyed by variant name, least recently used first
+        self.variants: OrderedDict[str, SplashBroadcast] = OrderedDict()
+        self.variants_lock = threading.Lock()
+        # Variant names waiting for the single render worker (see _variant_render_loop)
+        self._render_queue: queue.Queue = queue.Queue()
+        self._render_pending: set[str] = set()
+        # (loaded_at, channel group ids, channel ids) that variants may be created for
+        self._known_ids = (0.0, set(), set())
+        self._known_ids_lock = threading.Lock()
+        # Encoded clips shared by every splash, so identical pages are only encoded and held once
+        self._segment_cache: dict[str, TSSegment] = {}
+        self._segment_cache_lock = threading.Lock()
+        self.encoder = EncoderWatchdog()
+        config = TooManyStreamsConfig.get_config()
+        self.admission = AdmissionControl(
+            max_connections=config.max_viewers,
+            max_per_ip=config.max_viewers_per_ip,
+            local_addresses=(host,),
+        )
+        # False while the rendered pages haven't made it into the rotation (e.g. encoder failing)
+        self._pages_current = True
+        # (mtime_ns, size) of the static image as of its last successful load
+        self._static_loaded_stat = None
+        # True once the broadcasters run, i.e. viewers can be attached in-process (see LocalTransport)
+        self.serving = False
         
         # Ensure image directory exists
         os.makedirs(os.path.dirname(self.image_path), exist_ok=True)
+        # Encoded clips are persisted next to the generated image so a restart can serve them immediately
+        self.segment_cache_dir = os.path.join(os.path.dirname(self.image_path), self.SEGMENT_CACHE_DIR)
         
         self.ffmpeg_bin = shutil.which("ffmpeg")
         if not self.ffmpeg_bin:
@@ -37,10 +163,14 @@ class StreamServer:
         
         cmd = [
             self.ffmpeg_bin, 
+            "-loglevel", "error",
             "-loop", "1", 
             "-framerate", "1", 
             "-i", img_path,
             "-f", "lavfi", "-i", "anullsrc=r=48000:cl=stereo",
+            "-t", str(self.SEGMENT_SECONDS),
+            # Letterbox arbitrary (e.g. odd-sized static) images to 1080p
+            "-vf", "scale=1920:1080:force_original_aspect_ratio=decrease,pad=1920:1080:(ow-iw)/2:(oh-ih)/2",
             "-c:v", encoder,
         ]
         
@@ -64,160 +194,572 @@ class StreamServer:
         
         return cmd
 
-    def _start_ffmpeg(self):
-        with self.process_lock:
-            if self.process:
+    def _encoder_settings(self) -> str:
+        config = TooManyStreamsConfig.get_config()
+        return f"{config.video_encoder}|{self.SEGMENT_SECONDS}"
+
+    def _segment_key(self, image_data: bytes) -> str:
+        return md5(image_data + self._encoder_settings().encode()).hexdigest()
+
+    def _segment_file(self, key: str) -> str:
+        return os.path.join(self.segment_cache_dir, f"{key}.ts")
+
+    def _read_segment_file(self, key: str):
+        path = self._segment_file(key)
+        if not os.path.exists(path):
+            return None
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+            return TSSegment(data, self.SEGMENT_SECONDS, key=key) if data else None
+        except Exception as e:
+            logger.warning(f"Ignoring unreadable cached segment {path}: {e}")
+            return None
+
+    def _persist_pages(self, segments: list[TSSegment]) -> None:
+        """Writes the clips and a manifest of the current rotation, then prunes clips no longer used."""
+        try:
+            os.makedirs(self.segment_cache_dir, exist_ok=True)
+            for seg in segments:
+                path = self._segment_file(seg.key)
+                if not os.path.exists(path):
+                    with open(path + ".tmp", "wb") as f:
+                        f.write(seg.data)
+                    os.replace(path + ".tmp", path)
+
+            manifest = {
+                "settings": self._encoder_settings(),
+                "pages": [seg.key for seg in segments],
+            }
+            manifest_path = os.path.join(self.segment_cache_dir, self.MANIFEST_FILE)
+            with open(manifest_path + ".tmp", "w") as f:
+                json.dump(manifest, f)
+            os.replace(manifest_path + ".tmp", manifest_path)
+
+            keep = {f"{seg.key}.ts" for seg in segments} | {self.MANIFEST_FILE}
+            for name in os.listdir(self.segment_cache_dir):
+                if name not in keep:
+                    os.remove(os.path.join(self.segment_cache_dir, name))
+        except Exception as e:
+            logger.warning(f"Failed to persist encoded pages: {e}")
+
+    def _restore_pages(self) -> bool:
+        """Loads the last persisted rotation if it was encoded with the current settings."""
+        manifest_path = os.path.join(self.segment_cache_dir, self.MANIFEST_FILE)
+        try:
+            with open(manifest_path, "r") as f:
+                manifest = json.load(f)
+        except FileNotFoundError:
+            return False
+        except Exception as e:
+            logger.warning(f"Ignoring unreadable segment manifest: {e}")
+            return False
+
+        if manifest.get("settings") != self._encoder_settings():
+            logger.info("Encoder settings changed since the last run, not restoring cached pages.")
+            return False
+
+        segments = [self._read_segment_file(key) for key in manifest.get("pages", [])]
+        if not segments or None in segments:
+            return False
+
+        self.default.set_pages(segments)
+        with self._segment_cache_lock:
+            self._segment_cache.update({seg.key: seg for seg in segments})
+        logger.info(f"Restored {len(segments)} cached page(s), serving them until fresh content is ready.")
+        return True
+
+    def _encode_page(self, img_path) -> TSSegment:
+        """Encodes one page image into a TS clip, reusing the cached clip if the page is unchanged."""
+        with open(img_path, "rb") as f:
+            key = self._segment_key(f.read())
+
+        with self._segment_cache_lock:
+            cached = self._segment_cache.get(key)
+        if cached:
+            return cached
+        cached = self._read_segment_file(key)
+        if cached:
+            return cached
+
+        cmd = self._get_ffmpeg_cmd(img_path)
+        # logger.debug(f"Running FFmpeg: {' '.join(cmd)}")
+        data = self.encoder.run(cmd, media_seconds=self.SEGMENT_SECONDS, timeout=self.ENCODE_TIMEOUT_SEC)
+        return TSSegment(data, self.SEGMENT_SECONDS, key=key)
+
+    def _load_pages(self, page_paths, broadcast: SplashBroadcast = None) -> bool:
+        """
+        Encodes the given page images and swaps them into the broadcast (the default splash
+        unless given). Viewers keep watching without interruption.
+        If any page fails the current rotation is kept, so a half-encoded carousel never goes live.
+        """
+        broadcast = broadcast or self.default
+        segments = []
+        for path in page_paths:
+            try:
+                segments.append(self._encode_page(path))
+            except Exception as e:
+                logger.error(f"Failed to encode page {path}: {e}")
+                return False
+        if not segments:
+            return False
+
+        with self._segment_cache_lock:
+            self._segment_cache.update({seg.key: seg for seg in segments})
+        broadcast.set_pages(segments)
+        self._prune_segment_cache()
+        logger.info(f"Loaded {len(segments)} page(s) into the {broadcast.name} carousel.")
+        if broadcast is self.default:
+            self._persist_pages(segments)
+        return True
+
+    def _prune_segment_cache(self) -> None:
+        """Only keep clips for pages that are still in some rotation."""
+        with self.variants_lock:
+            broadcasts = [self.default, *self.variants.values()]
+        in_use = {key for b in broadcasts for key in b.page_keys()}
+        with self._segment_cache_lock:
+            for key in list(self._segment_cache):
+                if key not in in_use:
+                    del self._segment_cache[key]
+
+    @staticmethod
+    def variant_name(group_id: int = None, channel_id: int = None):
+        parts = []
+        if group_id is not None:
+            parts.append(f"g{group_id}")
+        if channel_id is not None:
+            parts.append(f"c{channel_id}")
+        return "-".join(parts) or None
+
+    def _variant_image_path(self, name: str) -> str:
+        return os.path.join(os.path.dirname(self.image_path), self.VARIANT_DIR, f"{name}.jpg")
+
+    def _known_variant_ids(self, group_id: int = None, channel_id: int = None) -> tuple:
+        """
+        Drops ids that don't belong to an existing channel group or channel, so clients can't
+        create variants for arbitrary ids. The id sets are reloaded at most every KNOWN_IDS_TTL_SEC.
+        """
+        if group_id is None and channel_id is None:
+            return None, None
+        with self._known_ids_lock:
+            loaded_at, groups, channels = self._known_ids
+            if time.monotonic() - loaded_at >= self.KNOWN_IDS_TTL_SEC:
                 try:
-                    if self.process.poll() is None:
-                        self.process.terminate()
-                        try:
-                            self.process.wait(timeout=1)
-                        except subprocess.TimeoutExpired:
-                            self.process.kill()
+                    groups = set(ChannelGroup.objects.values_list('id', flat=True))
+                    channels = set(Channel.objects.values_list('id', flat=True))
                 except Exception as e:
-                    logger.warning(f"Error terminating FFmpeg: {e}")
-            
-            if not os.path.exists(self.image_path):
-                 try:
-                     PillowImageGen(out_path=self.image_path).generate(force=True)
-                 except Exception as e:
-                     logger.error(f"Failed to generate initial image: {e}")
+                    logger.error(f"Could not load channel ids for splash variants: {e}")
+                self._known_ids = (time.monotonic(), groups, channels)
+        return (
+            group_id if group_id in groups else None,
+            channel_id if channel_id in channels else None,
+        )
+
+    def get_broadcast(self, group_id: int = None, channel_id: int = None, client: StreamClient = None) -> SplashBroadcast:
+        """
+        Returns the splash for the requested variant, creating it on demand, and marks it used
+        (adding the viewer, if given). New variants start out showing the default pages and
+        switch over once rendered. Unknown group or channel ids are ignored.
+        """
+        if not self.static_image_path:
+            group_id, channel_id = self._known_variant_ids(group_id, channel_id)
+        name = self.variant_name(group_id, channel_id)
+        if name is None or self.static_image_path:
+            broadcast = self.default
+            if client:
+                broadcast.add_client(client)
+            broadcast.touch()
+            return broadcast
+
+        with self.variants_lock:
+            broadcast = self.variants.get(name)
+            created = broadcast is None
+            if created:
+                broadcast = SplashBroadcast(name, group_id=group_id, channel_id=channel_id)
+                broadcast.set_pages(self.default.pages)
+                self.variants[name] = broadcast
+            self.variants.move_to_end(name)
+            if client:
+                broadcast.add_client(client)
+            broadcast.touch()
+
+        if created:
+            logger.info(f"Created splash variant {name}")
+            broadcast.start()
+            self._queue_variant_render(name)
+            self._evict_variants()
+        return broadcast
+
+    def find_broadcast(self, name: str):
+        if name == self.default.name:
+            return self.default
+        with self.variants_lock:
+            return self.variants.get(name)
 
-            cmd = self._get_ffmpeg_cmd(self.image_path)
-            # logger.debug(f"Starting FFmpeg: {' '.join(cmd)}")
+    def attach_client(self, address: str, group_id: int = None, channel_id: int = None) -> tuple[StreamClient, SplashBroadcast]:
+        """Creates a viewer on the requested splash. Callers must detach_client() it when done."""
+        config = TooManyStreamsConfig.get_config()
+        client = StreamClient(
+            address=address,
+            policy=config.slow_client_policy,
+            max_lag_sec=config.slow_client_max_lag,
+        )
+        broadcast = self.get_broadcast(group_id, channel_id, client=client)
+        
+        # Trigger a refresh
+        self.refresh_signal.set()
+        return client, broadcast
+
+    def detach_client(self, client: StreamClient, broadcast: SplashBroadcast) -> None:
+        broadcast.remove_client(client)
+
+    def _evict_variants(self) -> None:
+        """Drops variants idle for VARIANT_IDLE_SEC, and the least recently used idle ones beyond MAX_VARIANTS."""
+        evicted = []
+        with self.variants_lock:
+            for name, broadcast in list(self.variants.items()):
+                over_limit = len(self.variants) > self.MAX_VARIANTS
+                idle = broadcast.idle_for()
+                if idle and (idle >= self.VARIANT_IDLE_SEC or over_limit):
+                    del self.variants[name]
+                    evicted.append(broadcast)
+        for broadcast in evicted:
+            broadcast.stop()
+            logger.info(f"Evicted idle splash variant {broadcast.name}")
+        if evicted:
+            self._prune_segment_cache()
+
+    def _render_variant(self, broadcast: SplashBroadcast, active_streams: list = None, maxed_ids: set = None) -> None:
+        """
+        Renders a variant: the requested channel excluded, same-group alternatives first.
+        Callers refreshing several variants pass the active channels and maxed ids they already read.
+        """
+        with broadcast.render_lock:
             try:
-                self.process = subprocess.Popen(
-                    cmd, 
-                    stdout=subprocess.PIPE, 
-                    stderr=subprocess.DEVNULL
-                )
+                gen = PillowImageGen(out_path=self._variant_image_path(broadcast.name))
+                if active_streams is None:
+                    gen.get_active_streams()
+                else:
+                    gen.active_streams = active_streams
+                exclude = set(maxed_ids) if maxed_ids is not None else gen.get_maxed_channel_ids()
+                if broadcast.channel_id is not None:
+                    exclude.add(broadcast.channel_id)
+                gen.select_variant(group_id=broadcast.group_id, exclude_ids=exclude)
+
+                # Skip the render when this variant's channel list hasn't changed
+                inputs_key = gen.content_key()
+                if inputs_key == broadcast.inputs_key:
+                    return
+                if gen.generate(force=True) and self._load_pages(gen.page_paths, broadcast):
+                    broadcast.inputs_key = inputs_key
             except Exception as e:
-                logger.error(f"Failed to start FFmpeg: {e}")
-                self.process = None
+                logger.error(f"Variant {broadcast.name} update failed: {e}")
+
+    def _queue_variant_render(self, name: str) -> None:
+        with self.variants_lock:
+            if name in self._render_pending:
+                return
+            self._render_pending.add(name)
+        self._render_queue.put(name)
+
+    def _variant_render_loop(self):
+        """Renders newly created variants one at a time, so bursts of new variants queue up instead of running in parallel."""
+        while True:
+            name = self._render_queue.get()
+            with self.variants_lock:
+                self._render_pending.discard(name)
+                broadcast = self.variants.get(name)
+            # Variants evicted while queued are skipped
+            if broadcast is not None:
+                self._render_variant(broadcast)
+
+    def _refresh_variants(self, active_streams: list = None) -> None:
+        self._evict_variants()
+        with self.variants_lock:
+            broadcasts = list(self.variants.values())
+        if not broadcasts:
+            return
+        # One metadata scan and channel query for all variants, each only filters and sorts the list
+        gen = PillowImageGen(out_path=self.image_path)
+        if active_streams is None:
+            gen.get_active_streams()
+            active_streams = gen.active_streams
+        maxed_ids = gen.get_maxed_channel_ids()
+        for broadcast in broadcasts:
+            self._render_variant(broadcast, active_streams, maxed_ids)
 
     def _image_updater_loop(self):
         logger.info("Starting Image Updater loop")
         # Initial generation
         try:
-            PillowImageGen(out_path=self.image_path).generate()
+            gen = PillowImageGen(out_path=self.image_path)
+            gen.get_active_streams()
+            if gen.generate():
+                self._pages_current = self._load_pages(gen.page_paths)
         except Exception: pass
 
         while True:
-            # Wait for signal
-            signaled = self.refresh_signal.wait(timeout=60)
+            # Wait for signal, or retry sooner once a failed encode's backoff has elapsed
+            timeout = 60 if self._pages_current else max(1, self.encoder.backoff_remaining())
+            signaled = self.refresh_signal.wait(timeout=timeout)
             self.refresh_signal.clear()
             
             if signaled:
                 time.sleep(2) # Buffer for DB consistency
             
+            active_streams = None
             try:
                 gen = PillowImageGen(out_path=self.image_path)
-                # If content changed or we were explicitly signaled
-                if gen.get_active_streams() or signaled:
-                    if gen.generate():
-                        logger.info("Image updated, restarting FFmpeg stream.")
-                        self._start_ffmpeg()
+                # If content changed, we were explicitly signaled or the last encode failed
+                changed = gen.get_active_streams()
+                active_streams = gen.active_streams
+                if changed or signaled or not self._pages_current:
+                    if gen.generate(force=not self._pages_current):
+                        logger.info("Image updated, reloading carousel pages.")
+                        self._pages_current = self._load_pages(gen.page_paths)
             except Exception as e:
                 logger.error(f"Image update failed: {e}")
 
-    def _broadcaster_loop(self):
-        logger.info("Starting Broadcaster loop")
-        while True:
-            # Safely get current process
-            proc = self.process
-            
-            if not proc or not proc.stdout or proc.stdout.closed:
-                time.sleep(0.5)
-                # Check if we need to restart (e.g. startup failure)
-                with self.process_lock:
-                     if self.process is None:
-                         self._start_ffmpeg()
-                continue
-            
-            # Optimization: Pause if no clients
-            with self.clients_lock:
-                has_clients = len(self.clients) > 0
+            self._refresh_variants(active_streams)
 
-            if not has_clients:
-                time.sleep(1)
-                continue
+    def cache_stats(self) -> dict:
+        """Sizes of the in-memory caches: encoded clips and each splash's materialized HLS segments."""
+        with self._segment_cache_lock:
+            clips = list(self._segment_cache.values())
+        with self.variants_lock:
+            broadcasts = [self.default, *self.variants.values()]
+        return {
+            "segment_cache": {"clips": len(clips), "bytes": sum(len(seg) for seg in clips)},
+            "hls_segments": {b.name: b.hls_cache_stats() for b in broadcasts},
+        }
 
+    def get_client_stats(self) -> list[dict]:
+        with self.variants_lock:
+            broadcasts = [self.default, *self.variants.values()]
+        return [stats for b in broadcasts for stats in b.get_client_stats()]
+
+    @staticmethod
+    def _validate_image(path) -> bool:
+        try:
+            with Image.open(path) as img:
+                img.verify()
+                logger.info(f"Static image {path}: {img.format} {img.size[0]}x{img.size[1]}")
+            return True
+        except Exception as e:
+            logger.error(f"Static image {path} is not a valid image: {e}")
+            return False
+
+    def _load_static_image(self) -> bool:
+        try:
+            st = os.stat(self.static_image_path)
+        except OSError as e:
+            logger.error(f"Static image {self.static_image_path} is not readable: {e}")
+            return False
+        if not self._validate_image(self.static_image_path):
+            return False
+        # Unchanged images hash to an already encoded clip, so this only runs FFmpeg when the content changed
+        if not self._load_pages([self.static_image_path]):
+            return False
+        self._static_loaded_stat = (st.st_mtime_ns, st.st_size)
+        return True
+
+    def _static_watch_loop(self):
+        """Re-encodes the static image when its mtime or size changes. No DB, Redis or rendering work."""
+        logger.info("Starting Static Image watcher")
+        missing = False
+        while True:
             try:
-                buf = proc.stdout.read(1316 * 16) # Read 16 MPEG-TS packets
-                if not buf:
-                    # Stream ended?
-                    if proc.poll() is not None:
-                        # Only restart if it's still the SAME process object (wasn't replaced by updater)
-                        if self.process == proc:
-                            logger.warning("FFmpeg process exited. Restarting.")
-                            self._start_ffmpeg()
-                    time.sleep(0.1)
-                    continue
-                
-                with self.clients_lock:
-                    for q in self.clients[:]:
-                        try:
-                            q.put_nowait(buf)
-                        except queue.Full:
-                            pass
+                st = os.stat(self.static_image_path)
+                stat = (st.st_mtime_ns, st.st_size)
+                missing = False
+                # Compared with the last successful load, so a failed load or a re-created file is retried
+                if stat != self._static_loaded_stat:
+                    logger.info("Static image changed on disk, reloading.")
+                    self._load_static_image()
+            except FileNotFoundError:
+                if not missing:
+                    logger.warning(f"Static image {self.static_image_path} is missing, keeping the last encoded version.")
+                missing = True
             except Exception as e:
-                logger.error(f"Broadcaster error: {e}")
-                time.sleep(1)
+                logger.error(f"Static image watcher error: {e}")
+            time.sleep(self.STATIC_POLL_SEC)
+
+    def _start_static(self):
+        """Static mode: the user's image is encoded once and replayed. The image updater never runs."""
+        logger.info(f"Static image mode: {self.static_image_path}")
+        if not self._load_static_image():
+            logger.error("Static image could not be loaded, the stream will be unavailable until it is fixed.")
+        threading.Thread(target=self._static_watch_loop, daemon=True, name="TMS_StaticWatcher").start()
+
+    def _start_dynamic(self):
+        # Cold start: serve the last encoded pages right away, the updater replaces them in the background
+        if not self._restore_pages():
+            if not os.path.exists(self.image_path):
+                try:
+                    PillowImageGen(out_path=self.image_path).generate(force=True)
+                except Exception as e:
+                    logger.error(f"Failed to generate initial image: {e}")
+            self._load_pages([self.image_path])
+
+        threading.Thread(target=self._image_updater_loop, daemon=True, name="TMS_ImageUpdater").start()
+        threading.Thread(target=self._variant_render_loop, daemon=True, name="TMS_VariantRenderer").start()
 
     def start(self):
         if not self.ffmpeg_bin:
             return
 
-        self._start_ffmpeg()
-
-        threading.Thread(target=self._image_updater_loop, daemon=True, name="TMS_ImageUpdater").start()
-        threading.Thread(target=self._broadcaster_loop, daemon=True, name="TMS_Broadcaster").start()
+        if self.static_image_path:
+            self._start_static()
+        else:
+            self._start_dynamic()
+        self.default.start()
+        self.serving = True
 
         # Capture 'self' for the handler
         server_instance = self
 
+        config = TooManyStreamsConfig.get_config()
+
         class StreamHTTPHandler(BaseHTTPRequestHandler):
+            # Applied to the socket in setup(), so a stalled peer can't block a write forever
+            timeout = max(1, config.client_send_timeout)
+
+            def setup(self):
+                super().setup()
+                if self.connection.family == socket.AF_UNIX:
+                    return
+                try:
+                    self.connection.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+                    if hasattr(socket, "TCP_KEEPIDLE"):
+                        self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_KEEPIDLE, 10)
+                        self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_KEEPINTVL, 5)
+                        self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_KEEPCNT, 3)
+                except OSError as e:
+                    logger.debug(f"Could not enable TCP keepalive: {e}")
+
             def do_GET(self):
-                if self.path not in ("/", "/stream.ts"):
+                url = urlsplit(self.path)
+                # Optional personalization: ?group=<channel_group_id>&channel=<channel_id>
+                query = parse_qs(url.query)
+                def _int_param(name):
+                    try:
+                        return int(query[name][0])
+                    except (KeyError, IndexError, ValueError):
+                        return None
+                group_id, channel_id = _int_param("group"), _int_param("channel")
+
+                if url.path in ("/", "/stream.ts"):
+                    self._serve_stream(group_id, channel_id)
+                elif url.path == "/stream.m3u8":
+                    self._serve_playlist(group_id, channel_id)
+                elif url.path.startswith(HLS_PREFIX):
+                    self._serve_segment(url.path[len(HLS_PREFIX):])
+                else:
+                    self.send_response(404)
+                    self.end_headers()
+
+            def _serve_playlist(self, group_id, channel_id):
+                broadcast = server_instance.get_broadcast(group_id, channel_id)
+                body = broadcast.hls_playlist(lambda seq: f"{HLS_PREFIX}{broadcast.name}/{seq}.ts").encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "application/vnd.apple.mpegurl")
+                self.send_header("Content-Length", str(len(body)))
+                # Short enough to stay live, long enough for a reverse proxy to collapse viewer requests
+                self.send_header("Cache-Control", f"public, max-age={HLS_PLAYLIST_MAX_AGE}")
+                self.end_headers()
+                self.wfile.write(body)
+
+            def _serve_segment(self, rest):
+                # /hls/<splash>/<seq>.ts
+                try:
+                    name, filename = rest.split("/", 1)
+                    seq = int(filename[:-len(".ts")]) if filename.endswith(".ts") else None
+                except ValueError:
+                    seq = None
+                broadcast = server_instance.find_broadcast(name) if seq is not None else None
+                segment = broadcast.hls_segment(seq) if broadcast else None
+                if segment is None:
                     self.send_response(404)
                     self.end_headers()
                     return
+                broadcast.touch()
+
+                data, etag = segment
+                if self.headers.get("If-None-Match") == etag:
+                    self.send_response(304)
+                    self.send_header("ETag", etag)
+                    self.end_headers()
+                    return
+                self.send_response(200)
+                self.send_header("Content-Type", "video/mp2t")
+                self.send_header("Content-Length", str(len(data)))
+                self.send_header("ETag", etag)
+                # Segment bytes never change for a given URL
+                self.send_header("Cache-Control", "public, max-age=31536000, immutable")
+                self.end_headers()
+                self.wfile.write(data)
 
+            def _serve_stream(self, group_id, channel_id):
                 self.send_response(200)
                 self.send_header("Content-Type", "video/mp2t")
                 self.send_header("Connection", "keep-alive")
                 self.send_header("Cache-Control", "no-cache")
                 self.end_headers()
 
-                q = queue.Queue(maxsize=50)
-                with server_instance.clients_lock:
-                    server_instance.clients.append(q)
-                
-                # Trigger a refresh
-                server_instance.refresh_signal.set()
+                address = f"{self.client_address[0]}:{self.client_address[1]}" if isinstance(self.client_address, tuple) else "unix"
+                client, broadcast = server_instance.attach_client(address, group_id, channel_id)
 
                 try:
                     while True:
-                        chunk = q.get()
+                        try:
+                            chunk = client.get(timeout=self.timeout)
+                        except queue.Empty:
+                            # Nothing to send; make sure the viewer is still there so its slot is freed
+                            if self._peer_closed():
+                                break
+                            continue
+                        if chunk is None:
+                            break
                         self.wfile.write(chunk)
+                        client.record_sent(len(chunk))
                 except (ConnectionResetError, BrokenPipeError):
                     pass
+                except socket.timeout:
+                    logger.info(f"Client {client.address} write timed out, disconnecting.")
                 except Exception as e:
                     # logger.debug(f"Client connection error: {e}")
                     pass
                 finally:
-                    with server_instance.clients_lock:
-                        if q in server_instance.clients:
-                            server_instance.clients.remove(q)
+                    server_instance.detach_client(client, broadcast)
+                    logger.debug(f"Client disconnected: {client.stats()}")
+
+            def _peer_closed(self) -> bool:
+                try:
+                    readable, _, _ = select.select([self.connection], [], [], 0)
+                    return bool(readable) and self.connection.recv(1, socket.MSG_PEEK) == b""
+                except OSError:
+                    return True
 
             def log_message(self, format, *args):
                 pass
 
+        if config.local_transport:
+            self._start_unix_server(StreamHTTPHandler)
+
         logger.info(f"Starting TooManyStreams HTTP Server on {self.host}:{self.port}")
-        # Allow reuse address to prevent "Address already in use" on quick restarts
-        ThreadingHTTPServer.allow_reuse_address = True
-        httpd = ThreadingHTTPServer((self.host, self.port), StreamHTTPHandler)
+        httpd = AdmissionHTTPServer((self.host, self.port), StreamHTTPHandler, self.admission)
         try:
             httpd.serve_forever()
         except Exception as e:
             logger.error(f"HTTP Server crashed: {e}")
+
+    def _start_unix_server(self, handler_class):
+        path = TooManyStreamsConfig.get_socket_path()
+        try:
+            httpd = AdmissionUnixHTTPServer(path, handler_class, self.admission)
+        except OSError as e:
+            logger.error(f"Could not listen on {path}: {e}")
+            return
+        logger.info(f"Starting TooManyStreams HTTP Server on unix:{path}")
+        threading.Thread(target=httpd.serve_forever, daemon=True, name="TMS_UnixServer").start()
@@ -0,0 +1,123 @@
+import logging
+
+from .StreamClient import TS_PACKET_SIZE, TS_SYNC_BYTE
+
+logger = logging.getLogger('plugins.too_many_streams.TSSegment')
+
+TS_CLOCK = 90000
+TS_MASK = (1 << 33) - 1
+
+
+def _read_pts(buf, o: int) -> int:
+    return (((buf[o] >> 1) & 0x07) << 30) | (buf[o + 1] << 22) | ((buf[o + 2] >> 1) << 15) | (buf[o + 3] << 7) | (buf[o + 4] >> 1)
+
+
+def _write_pts(buf: bytearray, o: int, ts: int) -> None:
+    buf[o] = (buf[o] & 0xF0) | ((ts >> 29) & 0x0E) | 0x01
+    buf[o + 1] = (ts >> 22) & 0xFF
+    buf[o + 2] = ((ts >> 14) & 0xFE) | 0x01
+    buf[o + 3] = (ts >> 7) & 0xFF
+    buf[o + 4] = ((ts << 1) & 0xFE) | 0x01
+
+
+def _read_pcr_base(buf, o: int) -> int:
+    return (buf[o] << 25) | (buf[o + 1] << 17) | (buf[o + 2] << 9) | (buf[o + 3] << 1) | (buf[o + 4] >> 7)
+
+
+def _write_pcr_base(buf: bytearray, o: int, base: int) -> None:
+    buf[o] = (base >> 25) & 0xFF
+    buf[o + 1] = (base >> 17) & 0xFF
+    buf[o + 2] = (base >> 9) & 0xFF
+    buf[o + 3] = (base >> 1) & 0xFF
+    buf[o + 4] = ((base & 0x01) << 7) | (buf[o + 4] & 0x7F)
+
+
+class TSSegment:
+    """
+    A pre-encoded MPEG-TS clip of a fixed duration. Parsed once on creation so it can be
+    replayed back to back (see TSRestamper) without touching FFmpeg again.
+    """
+
+    def __init__(self, data: bytes, duration: float, key: str = None):
+        usable = len(data) - (len(data) % TS_PACKET_SIZE)
+        self.data = bytes(data[:usable])
+        self.duration = duration
+        self.duration_90k = int(round(duration * TS_CLOCK))
+        self.key = key
+
+        # (offset, pid, has_payload) per packet, plus the offsets of every timestamp field
+        self.packets: list[tuple[int, int, bool]] = []
+        self.pts_offsets: list[int] = []
+        self.pcr_offsets: list[int] = []
+        self.base_pts = None
+        self._parse()
+
+    def __len__(self):
+        return len(self.data)
+
+    def _parse(self) -> None:
+        buf = self.data
+        for i in range(0, len(buf), TS_PACKET_SIZE):
+            if buf[i] != TS_SYNC_BYTE:
+                continue
+            pid = ((buf[i + 1] & 0x1F) << 8) | buf[i + 2]
+            afc = (buf[i + 3] >> 4) & 0x3
+            self.packets.append((i, pid, bool(afc & 0x1)))
+
+            payload = i + 4
+            if afc & 0x2:
+                af_len = buf[i + 4]
+                if af_len >= 7 and buf[i + 5] & 0x10:
+                    self.pcr_offsets.append(i + 6)
+                payload = i + 5 + af_len
+
+            # PES header with PTS (and maybe DTS) at the start of a payload unit
+            if not (afc & 0x1 and buf[i + 1] & 0x40) or payload + 19 > i + TS_PACKET_SIZE:
+                continue
+            if buf[payload:payload + 3] != b"\x00\x00\x01" or buf[payload + 3] < 0xC0:
+                continue
+            flags = buf[payload + 7] >> 6
+            if flags & 0x2:
+                self.pts_offsets.append(payload + 9)
+                pts = _read_pts(buf, payload + 9)
+                self.base_pts = pts if self.base_pts is None else min(self.base_pts, pts)
+            if flags == 0x3:
+                self.pts_offsets.append(payload + 14)
+
+        if self.base_pts is None:
+            self.base_pts = 0
+            logger.warning("Encoded segment contains no timestamps, playback may stutter.")
+
+
+class TSRestamper:
+    """
+    Rewrites PTS/DTS/PCR and continuity counters so any sequence of TSSegments plays as
+    one continuous stream. Keep one instance per output stream.
+    """
+
+    # Start well clear of zero so PCRs (which lead PTS slightly) never wrap
+    START_CLOCK = 10 * TS_CLOCK
+
+    def __init__(self, clock: int = None):
+        self.clock = self.START_CLOCK if clock is None else clock & TS_MASK
+        self._cc: dict[int, int] = {}
+
+    def restamp(self, segment: TSSegment) -> bytes:
+        buf = bytearray(segment.data)
+        shift = self.clock - segment.base_pts
+
+        for o in segment.pts_offsets:
+            _write_pts(buf, o, (_read_pts(buf, o) + shift) & TS_MASK)
+        for o in segment.pcr_offsets:
+            _write_pcr_base(buf, o, (_read_pcr_base(buf, o) + shift) & TS_MASK)
+
+        cc = self._cc
+        for o, pid, has_payload in segment.packets:
+            counter = cc.get(pid, 0x0F)
+            if has_payload:
+                counter = (counter + 1) & 0x0F
+                cc[pid] = counter
+            buf[o + 3] = (buf[o + 3] & 0xF0) | counter
+
+        self.clock = (self.clock + segment.duration_90k) & TS_MASK
+        return bytes(buf)
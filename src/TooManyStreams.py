@@ -5,13 +5,22 @@ import os
 import threading
 
 from apps.channels.models import Channel, ChannelStream, Stream
+from apps.proxy.ts_proxy.channel_status import ChannelStatus
 from apps.proxy.ts_proxy.server import ProxyServer
 from apps.proxy.ts_proxy.services.channel_service import ChannelService
 from core.utils import RedisClient
 
 from .TooManyStreamsConfig import TooManyStreamsConfig
 from .exceptions import TMS_CustomStreamNotFound
+from .ChannelAttacher import ChannelAttacher
+from .LocalTransport import LocalTransport
+from .ParkedViewers import PROMOTE_DONE, PROMOTE_GONE, PROMOTE_WAIT, ParkedViewers
+from .PluginProfiler import PluginProfiler
+from .ProfileSelector import Candidate, ProfileSelector
+from .RenderWorker import RenderWorker
+from .SaturationStats import SaturationStats
 from .StreamServer import StreamServer
+from .TunableIndex import TunableIndex
 
 logger = logging.getLogger('plugins.too_many_streams.TooManyStreams')
 logger.setLevel(os.environ.get("TMS_LOG_LEVEL", os.environ.get("DISPATCHARR_LOG_LEVEL", "INFO")).upper())
@@ -23,6 +32,7 @@ class TooManyStreams:
     TMS_MAXED_COUNTER = 1
     
     REFRESH_SIGNAL = threading.Event()
+    STREAM_SERVER = None
 
     @staticmethod
     def check_requirements_met() -> bool:
@@ -59,6 +69,35 @@ class TooManyStreams:
             }
             return Stream.objects.create(**data)
 
+    @staticmethod
+    def get_variant_stream(group_id) -> Stream:
+        """
+        The TMS stream personalized for a channel group. Each group gets its own Stream row
+        (pointing at /stream.ts?group=<id>) so the proxy asks StreamServer for that variant.
+        Static mode serves one image to everyone, so it always gets the plain stream.
+        """
+        config = TooManyStreamsConfig.get_config()
+        if group_id is None or not config.personalize_splash or config.tms_image_path:
+            return TooManyStreams.get_stream()
+
+        url = TooManyStreamsConfig.get_stream_url(group_id=group_id)
+        # Resolved on every call: the rows can be removed by another worker (see remove_variant_streams)
+        stream = Stream.objects.filter(name=TooManyStreams.STREAM_NAME, url=url).first()
+        if stream is None:
+            stream = Stream.objects.create(
+                name=TooManyStreams.STREAM_NAME,
+                url=url,
+                is_custom=True,
+                channel_group=None,
+                stream_profile_id=None,
+            )
+        return stream
+
+    @staticmethod
+    def remove_variant_streams() -> None:
+        base_url = TooManyStreamsConfig.get_stream_url()
+        Stream.objects.filter(name=TooManyStreams.STREAM_NAME, url__startswith=f"{base_url}?").delete()
+
     @staticmethod
     def add_stream_to_channel(channel_id:int) -> None:
         custom_stream = TooManyStreams.get_or_create_stream()
@@ -68,6 +107,28 @@ class TooManyStreams:
                 ChannelStream.objects.create(channel=channel, stream_id=custom_stream.id, order=9999)
         except Exception: pass
 
+    @staticmethod
+    def add_stream_to_channels(channel_ids=None) -> int:
+        """
+        Attaches the TMS stream to every given channel (or every channel) that lacks it,
+        with one query and one bulk insert. Returns the number of channels updated.
+        """
+        custom_stream = TooManyStreams.get_or_create_stream()
+        channels = Channel.objects.exclude(streams=custom_stream)
+        if channel_ids is not None:
+            channels = channels.filter(id__in=list(channel_ids))
+        missing = list(channels.values_list('id', flat=True))
+        ChannelStream.objects.bulk_create(
+            [ChannelStream(channel_id=channel_id, stream_id=custom_stream.id, order=9999) for channel_id in missing],
+            batch_size=500,
+        )
+        return len(missing)
+
+    @staticmethod
+    def install_auto_attach() -> None:
+        if TooManyStreamsConfig.get_config().auto_attach_stream:
+            ChannelAttacher.get_instance(TooManyStreams.add_stream_to_channels).install()
+
     @staticmethod   
     def remove_stream_from_channel(channel_id:int) -> None:
         custom_stream = TooManyStreams.get_or_create_stream()
@@ -82,12 +143,13 @@ class TooManyStreams:
         except Exception: pass
 
     @staticmethod
-    def mark_streams_maxed(channel_id) -> None:
+    def mark_streams_maxed(channel_id, profile_ids=()) -> None:
         channel_id = str(channel_id)
         redis_client = RedisClient.get_client()
         key = f"tms:maxed_out:{channel_id}"
         redis_client.incr(key)
         redis_client.expire(key, TooManyStreams.TMS_MAXED_TTL_SEC)
+        SaturationStats.record_saturation(channel_id, profile_ids)
 
     @staticmethod
     def is_streams_maxed(channel_id) -> bool:
@@ -99,6 +161,8 @@ class TooManyStreams:
         except: val = 0
         
         is_maxed = val >= TooManyStreams.TMS_MAXED_COUNTER
+        # With auto-attach the stream is already in place, keep ORM writes off the tune path
+        if TooManyStreamsConfig.get_config().auto_attach_stream: return is_maxed
         if is_maxed: TooManyStreams.add_stream_to_channel(channel_id)
         else: TooManyStreams.remove_stream_from_channel(channel_id)
         return is_maxed
@@ -107,6 +171,28 @@ class TooManyStreams:
     def trigger_refresh():
         TooManyStreams.REFRESH_SIGNAL.set()
 
+    @staticmethod
+    def get_candidates(channel) -> list[Candidate]:
+        """
+        Every active (stream, M3U profile) pair of the channel in preference order (channel
+        stream order, default profile first), with connection counters loaded in one round trip.
+        """
+        candidates = []
+        streams = channel.streams.all().order_by("channelstream__order") \
+            .select_related("m3u_account").prefetch_related("m3u_account__profiles")
+
+        for stream in streams:
+            m3u_account = stream.m3u_account
+            if not m3u_account: continue
+
+            # Ensure default profile is checked first
+            sorted_profiles = sorted(m3u_account.profiles.all(), key=lambda x: not x.is_default)
+            for profile in sorted_profiles:
+                if not profile.is_active: continue
+                candidates.append(Candidate(stream.id, profile.id, profile.max_streams))
+
+        return ProfileSelector.load_connections(RedisClient.get_client(), candidates)
+
     @staticmethod
     def install_get_stream_override():
         from apps.channels.models import Channel 
@@ -131,43 +217,31 @@ class TooManyStreams:
                     except (ValueError, TypeError): pass
 
                 # 2. Try to find an available stream
-                has_streams_but_maxed_out = False
-                has_active_profiles = False
-
-                for stream in self.streams.all().order_by("channelstream__order"):
-                    m3u_account = stream.m3u_account
-                    if not m3u_account: continue
-
-                    profiles = m3u_account.profiles.all()
-                    # Ensure default profile is checked first
-                    sorted_profiles = sorted(profiles, key=lambda x: not x.is_default)
-
-                    for profile in sorted_profiles:
-                        if not profile.is_active: continue
-                        has_active_profiles = True
-
-                        profile_connections_key = f"profile_connections:{profile.id}"
-                        current_connections = int(redis_client.get(profile_connections_key) or 0)
-
-                        if profile.max_streams == 0 or current_connections < profile.max_streams:
-                            redis_client.set(f"channel_stream:{self.id}", stream.id)
-                            redis_client.set(f"stream_profile:{stream.id}", profile.id)
-                            if profile.max_streams > 0: redis_client.incr(profile_connections_key)
-                            
-                            TooManyStreams.trigger_refresh()
-                            return stream.id, profile.id, None
-                        else:
-                            has_streams_but_maxed_out = True
+                candidates = TooManyStreams.get_candidates(self)
+                has_active_profiles = bool(candidates)
+                strategy = TooManyStreamsConfig.get_config().profile_selection_strategy
+                choice = ProfileSelector.select(strategy, candidates, channel_id=self.id, redis_client=redis_client)
+
+                if choice is not None:
+                    redis_client.set(f"channel_stream:{self.id}", choice.stream_id)
+                    redis_client.set(f"stream_profile:{choice.stream_id}", choice.profile_id)
+                    if not choice.unlimited: redis_client.incr(f"profile_connections:{choice.profile_id}")
+
+                    TooManyStreams.trigger_refresh()
+                    return choice.stream_id, choice.profile_id, None
+                has_streams_but_maxed_out = bool(candidates)
 
                 # 3. Handle maxed out scenario
                 if has_streams_but_maxed_out:
                     if not TooManyStreams.is_streams_maxed(self.id):
-                        TooManyStreams.mark_streams_maxed(self.id)
+                        TooManyStreams.mark_streams_maxed(self.id, [c.profile_id for c in candidates])
                         return None, None, "All M3U profiles have reached maximum connection limits"
                     
-                    # Return our custom stream
+                    # Return our custom stream, personalized for this channel's group
                     try:
-                        custom_stream = TooManyStreams.get_stream()
+                        custom_stream = TooManyStreams.get_variant_stream(self.channel_group_id)
+                        if TooManyStreamsConfig.get_config().promote_parked_viewers:
+                            ParkedViewers.park(self.id)
                         return custom_stream.id, None, None
                     except: pass
 
@@ -176,15 +250,89 @@ class TooManyStreams:
 
             Channel.get_stream = _wrapped_get_stream
 
+    @staticmethod
+    def promote_parked_channel(channel_id) -> str:
+        """
+        Switches a channel parked on the TMS stream back to a real stream if one of its
+        profiles has a free slot, using the proxy's stream switch.
+        """
+        channel = Channel.objects.filter(id=channel_id).only('id', 'uuid').first()
+        if channel is None:
+            return PROMOTE_GONE
+        channel_info = ChannelStatus.get_basic_channel_info(str(channel.uuid)) or {}
+        if not TooManyStreamsConfig.is_stream_url(channel_info.get("url")):
+            # Stopped, or already back on a real stream
+            return PROMOTE_GONE
+
+        redis_client = RedisClient.get_client()
+        strategy = TooManyStreamsConfig.get_config().profile_selection_strategy
+        choice = ProfileSelector.select(strategy, TooManyStreams.get_candidates(channel), channel_id=channel.id, redis_client=redis_client)
+        if choice is None:
+            return PROMOTE_WAIT
+
+        redis_client.delete(f"tms:maxed_out:{channel.id}")
+        result = ChannelService.change_stream_url(str(channel.uuid), target_stream_id=choice.stream_id)
+        if isinstance(result, dict) and result.get("status") == "error":
+            logger.warning(f"Could not switch channel {channel.id} to stream {choice.stream_id}: {result.get('message')}")
+            return PROMOTE_WAIT
+        TooManyStreams.trigger_refresh()
+        return PROMOTE_DONE
+
+    @staticmethod
+    def install_local_transport() -> None:
+        if TooManyStreamsConfig.get_config().local_transport:
+            LocalTransport.install(
+                get_server=lambda: TooManyStreams.STREAM_SERVER,
+                stream_url=TooManyStreamsConfig.get_stream_url(),
+                socket_path=TooManyStreamsConfig.get_socket_path(),
+            )
+
     @staticmethod
     def apply_to_all_channels():
-        for c in Channel.objects.all(): TooManyStreams.add_stream_to_channel(c.id)
+        count = TooManyStreams.add_stream_to_channels()
+        logger.info(f"Added the 'Too Many Streams' stream to {count} channel(s).")
 
     @staticmethod
     def remove_from_all_channels():
+        if TooManyStreamsConfig.get_config().auto_attach_stream:
+            logger.warning("Auto-attach is enabled, new and re-imported channels will get the stream again.")
         for c in Channel.objects.all(): TooManyStreams.remove_stream_from_channel(c.id)
+        TooManyStreams.remove_variant_streams()
 
     @staticmethod
     def stream_still_mpegts_http_thread(image_path=None, host="127.0.0.1", port=8081):
         server = StreamServer(host=host, port=port, image_path=image_path, refresh_signal=TooManyStreams.REFRESH_SIGNAL)
+        TooManyStreams.STREAM_SERVER = server
+        # Static mode promises no DB queries or Redis scans, so the sampler never runs there
+        if TooManyStreamsConfig.get_config().saturation_sampling and not image_path:
+            SaturationStats.start_sampler()
+        if TooManyStreamsConfig.get_config().promote_parked_viewers:
+            ParkedViewers.get_instance(TooManyStreams.promote_parked_channel).start()
+        # Nothing reads the index in static mode
+        if TooManyStreamsConfig.get_config().tunable_index and not image_path:
+            TunableIndex.get_instance().start()
         server.start()
+
+    @staticmethod
+    def get_stream_server_stats() -> dict:
+        server = TooManyStreams.STREAM_SERVER
+        if server is None:
+            return {"running": False, "clients": [], "encoder": None, "admission": None, "auto_attach": None, "parked_viewers": None, "tunable_index": None, "render_worker": None}
+        return {
+            "running": True,
+            "clients": server.get_client_stats(),
+            "encoder": server.encoder.health(),
+            "admission": server.admission.stats(),
+            "auto_attach": ChannelAttacher.get_instance(TooManyStreams.add_stream_to_channels).stats(),
+            "parked_viewers": ParkedViewers.get_instance(TooManyStreams.promote_parked_channel).stats(),
+            "tunable_index": TunableIndex.get_instance().stats(),
+            "render_worker": RenderWorker.get_instance().stats(),
+        }
+
+    @staticmethod
+    def get_saturation_report(hours: int = 24) -> dict:
+        return SaturationStats.get_report(hours)
+
+    @staticmethod
+    def profile_plugin(duration: float = PluginProfiler.DEFAULT_DURATION_SEC) -> dict:
+        return PluginProfiler.run(duration, server=TooManyStreams.STREAM_SERVER)
@@ -98,12 +98,29 @@ class TooManyStreamsConfig:
         _host = os.environ.get("TMS_HOST", "0.0.0.0")
         _port = int(os.environ.get("TMS_PORT", 1337))
         return (_host, _port)
-    
+
+    @staticmethod
+    def get_socket_path() -> str:
+        """Unix domain socket the stream server also listens on when local_transport is enabled."""
+        _, port = TooManyStreamsConfig.get_host_and_port()
+        return os.environ.get("TMS_SOCKET", f"/tmp/tms_{port}.sock")
+
     @staticmethod
-    def get_stream_url() -> str:
+    def get_stream_url(group_id: int = None) -> str:
+        """URL of the TMS stream; with a group_id, the splash personalized for that channel group."""
         host, port = TooManyStreamsConfig.get_host_and_port()
         display_host = "127.0.0.1" if host == "0.0.0.0" else host
-        return TooManyStreamsConfig._STREAM_URL.format(host=display_host, port=port)
+        url = TooManyStreamsConfig._STREAM_URL.format(host=display_host, port=port)
+        if group_id is not None:
+            url += f"?group={int(group_id)}"
+        return url
+
+    @staticmethod
+    def is_stream_url(url: str) -> bool:
+        """True for the TMS stream URL and any of its personalized variants."""
+        if not url:
+            return False
+        return url.split("?", 1)[0] == TooManyStreamsConfig.get_stream_url()
             
     @staticmethod
     def save_plugin_persistent_config(config: dict):
@@ -0,0 +1,173 @@
+import logging
+import re
+import threading
+import time
+
+from core.utils import RedisClient
+
+from . import KeyspaceEvents
+from .TooManyStreamsConfig import TooManyStreamsConfig
+
+logger = logging.getLogger('plugins.too_many_streams.TunableIndex')
+
+
+class TunableIndex:
+    """
+    Redis set of the channel uuids a viewer can join right now: channels the proxy is
+    running on a real stream that aren't stopping or failing. Joining one costs no
+    provider connection. Channels serving the TMS stream are left out, since a new
+    viewer would land on that splash session.
+
+    One maintainer (in the process that owns the stream server) updates the set from
+    keyspace notifications on the proxy's channel metadata and writes only the members
+    that change, so readers only do an SMEMBERS. Without keyspace notifications it
+    re-reads the metadata on a short poll instead. No database work is involved.
+    """
+
+    KEY = "tms:tunable"
+    # Present while a maintainer is keeping KEY current
+    READY_KEY = "tms:tunable:ready"
+    READY_TTL_SEC = 60
+    # Full re-read that catches missed events
+    RESYNC_SEC = 300
+    POLL_SEC = 5
+    # Hashes for metadata writes, generic and expired for channels going away
+    KEYSPACE_FLAGS = "hgx"
+    METADATA_PATTERN = "ts_proxy:channel:*:metadata"
+    NOT_JOINABLE_STATES = {"error", "stopping", "stopped"}
+
+    _instance = None
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.tunable: set[str] = set()
+        self.keyspace_events = False
+        self.updates = 0
+        self.synced_at = None
+        self._thread = None
+
+    @classmethod
+    def get_instance(cls) -> "TunableIndex":
+        if cls._instance is None:
+            cls._instance = cls()
+        return cls._instance
+
+    @staticmethod
+    def get_tunable_uuids():
+        """The indexed channel uuids, or None if no maintainer is keeping the index current."""
+        redis_client = RedisClient.get_client()
+        pipe = redis_client.pipeline(transaction=False)
+        pipe.exists(TunableIndex.READY_KEY)
+        pipe.smembers(TunableIndex.KEY)
+        ready, members = pipe.execute()
+        if not ready:
+            return None
+        return {m.decode() if isinstance(m, bytes) else m for m in members}
+
+    def start(self) -> None:
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._maintain_loop, daemon=True, name="TMS_TunableIndex")
+            self._thread.start()
+
+    @staticmethod
+    def _is_tunable(url, state) -> bool:
+        if isinstance(url, bytes):
+            url = url.decode()
+        if isinstance(state, bytes):
+            state = state.decode()
+        return bool(url) and not TooManyStreamsConfig.is_stream_url(url) and state not in TunableIndex.NOT_JOINABLE_STATES
+
+    def _read_tunable(self, redis_client) -> set[str]:
+        uuids = []
+        for key in redis_client.scan_iter(match=self.METADATA_PATTERN):
+            m = re.search(r"ts_proxy:channel:(.*):metadata", key.decode("utf-8") if isinstance(key, bytes) else key)
+            if m:
+                uuids.append(m.group(1))
+        if not uuids:
+            return set()
+        pipe = redis_client.pipeline(transaction=False)
+        for uuid in uuids:
+            pipe.hmget(f"ts_proxy:channel:{uuid}:metadata", "url", "state")
+        return {uuid for uuid, (url, state) in zip(uuids, pipe.execute()) if self._is_tunable(url, state)}
+
+    def _apply(self, redis_client, add, remove) -> None:
+        """Writes the changed members. Callers hold self.lock."""
+        add, remove = set(add) - self.tunable, set(remove) & self.tunable
+        if not add and not remove:
+            return
+        pipe = redis_client.pipeline(transaction=False)
+        if add:
+            pipe.sadd(self.KEY, *add)
+        if remove:
+            pipe.srem(self.KEY, *remove)
+        pipe.execute()
+        self.tunable |= add
+        self.tunable -= remove
+        self.updates += len(add) + len(remove)
+
+    def resync(self) -> None:
+        """Re-reads every channel's metadata and rewrites the set."""
+        redis_client = RedisClient.get_client()
+        with self.lock:
+            tunable = self._read_tunable(redis_client)
+            pipe = redis_client.pipeline(transaction=True)
+            pipe.delete(self.KEY)
+            if tunable:
+                pipe.sadd(self.KEY, *tunable)
+            pipe.set(self.READY_KEY, 1, ex=self.READY_TTL_SEC)
+            pipe.execute()
+            self.tunable = tunable
+        self.synced_at = time.time()
+        logger.debug(f"Tunable index resynced: {len(tunable)} channel(s).")
+
+    def on_channel_changed(self, redis_client, uuid: str) -> None:
+        url, state = redis_client.hmget(f"ts_proxy:channel:{uuid}:metadata", "url", "state")
+        with self.lock:
+            if self._is_tunable(url, state):
+                self._apply(redis_client, (uuid,), ())
+            else:
+                self._apply(redis_client, (), (uuid,))
+
+    def _handle_events(self, redis_client, events) -> None:
+        uuids = set()
+        for key, _ in events:
+            if key.startswith("ts_proxy:channel:") and key.endswith(":metadata"):
+                uuids.add(key[len("ts_proxy:channel:"):-len(":metadata")])
+        for uuid in uuids:
+            self.on_channel_changed(redis_client, uuid)
+
+    def _maintain_loop(self):
+        redis_client = RedisClient.get_client()
+        pubsub = None
+        if KeyspaceEvents.enable(redis_client, self.KEYSPACE_FLAGS):
+            pubsub = KeyspaceEvents.subscribe(redis_client, self.METADATA_PATTERN)
+            self.keyspace_events = True
+        # Without events the periodic resync is the only update
+        resync_sec = self.RESYNC_SEC if pubsub is not None else self.POLL_SEC
+
+        last_resync = 0.0
+        while True:
+            try:
+                now = time.monotonic()
+                if now - last_resync >= resync_sec:
+                    self.resync()
+                    last_resync = now
+
+                if pubsub is not None:
+                    self._handle_events(redis_client, KeyspaceEvents.drain(pubsub, self.POLL_SEC))
+                else:
+                    time.sleep(self.POLL_SEC)
+                redis_client.set(self.READY_KEY, 1, ex=self.READY_TTL_SEC)
+            except Exception as e:
+                logger.error(f"Tunable index maintenance failed: {e}", exc_info=True)
+                time.sleep(self.POLL_SEC)
+
+    def stats(self) -> dict:
+        with self.lock:
+            return {
+                "enabled": self._thread is not None,
+                "keyspace_events": self.keyspace_events,
+                "tunable_channels": len(self.tunable),
+                "incremental_updates": self.updates,
+                "synced_at": self.synced_at,
+            }
@@ -6,4 +6,12 @@ class TooManyStreamsException(Exception):
 
 class TMS_CustomStreamNotFound(TooManyStreamsException):
     """Raised when a custom stream is not found"""
-    pass
\ No newline at end of file
+    pass
+
+class TMS_RenderWorkerError(TooManyStreamsException):
+    """Raised when the render worker fails, times out or dies mid-render"""
+    pass
+
+class TMS_EncoderError(TooManyStreamsException):
+    """Raised when an FFmpeg encode fails, stalls or is held back by the watchdog"""
+    pass
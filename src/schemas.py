@@ -1,16 +1,39 @@
 from dataclasses import dataclass, asdict
 from typing import Optional
 
+
+def _as_bool(value) -> bool:
+    if isinstance(value, str):
+        return value.strip().lower() in ("1", "true", "yes", "on")
+    return bool(value)
+
 @dataclass
 class PluginConfig:
     stream_title: str = "Sorry, this channel is unavailable."
     stream_description: str = "While this channel is not currently available, here are some other channels you can watch."
     stream_channel_cols: int = 5
+    carousel_interval: int = 10
+    carousel_max_pages: int = 10
+    personalize_splash: bool = True
     tms_image_path: Optional[str] = None
     tms_log_level: str = "INFO"
     
     # Advanced / Performance
     video_encoder: str = "libx264"
+    render_backend: str = "thread"
+    render_timeout: int = 30
+    client_send_timeout: int = 10
+    slow_client_policy: str = "skip"
+    slow_client_max_lag: int = 10
+    max_viewers: int = 200
+    max_viewers_per_ip: int = 10
+    profile_selection_strategy: str = "first_fit"
+    auto_attach_stream: bool = False
+    local_transport: bool = False
+    promote_parked_viewers: bool = False
+    tunable_index: bool = False
+    saturation_sampling: bool = False
+    redis_keyspace_events: bool = False
     
     # Theme Colors
     theme_bg_color: str = "#0F172A"
@@ -26,10 +49,27 @@ class PluginConfig:
             stream_title=str(data.get("stream_title", cls.stream_title)),
             stream_description=str(data.get("stream_description", cls.stream_description)),
             stream_channel_cols=int(data.get("stream_channel_cols", cls.stream_channel_cols)),
+            carousel_interval=int(data.get("carousel_interval", cls.carousel_interval)),
+            carousel_max_pages=int(data.get("carousel_max_pages", cls.carousel_max_pages)),
+            personalize_splash=_as_bool(data.get("personalize_splash", cls.personalize_splash)),
             tms_image_path=data.get("tms_image_path", cls.tms_image_path),
             tms_log_level=str(data.get("tms_log_level", cls.tms_log_level)).upper(),
             
             video_encoder=str(data.get("video_encoder", cls.video_encoder)),
+            render_backend=str(data.get("render_backend", cls.render_backend)).lower(),
+            render_timeout=int(data.get("render_timeout", cls.render_timeout)),
+            client_send_timeout=int(data.get("client_send_timeout", cls.client_send_timeout)),
+            slow_client_policy=str(data.get("slow_client_policy", cls.slow_client_policy)).lower(),
+            slow_client_max_lag=int(data.get("slow_client_max_lag", cls.slow_client_max_lag)),
+            max_viewers=int(data.get("max_viewers", cls.max_viewers)),
+            max_viewers_per_ip=int(data.get("max_viewers_per_ip", cls.max_viewers_per_ip)),
+            profile_selection_strategy=str(data.get("profile_selection_strategy", cls.profile_selection_strategy)).lower(),
+            auto_attach_stream=_as_bool(data.get("auto_attach_stream", cls.auto_attach_stream)),
+            local_transport=_as_bool(data.get("local_transport", cls.local_transport)),
+            promote_parked_viewers=_as_bool(data.get("promote_parked_viewers", cls.promote_parked_viewers)),
+            tunable_index=_as_bool(data.get("tunable_index", cls.tunable_index)),
+            saturation_sampling=_as_bool(data.get("saturation_sampling", cls.saturation_sampling)),
+            redis_keyspace_events=_as_bool(data.get("redis_keyspace_events", cls.redis_keyspace_events)),
             
             theme_bg_color=str(data.get("theme_bg_color", cls.theme_bg_color)),
             theme_card_bg_color=str(data.get("theme_card_bg_color", cls.theme_card_bg_color)),